@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк времени запуска точки входа database.
+
+Запускает импорт src.primitive_db.main в отдельных процессах и сравнивает
+медианное время импорта с бюджетом. Завершается с кодом 1, если бюджет
+превышен или при запуске подгружаются тяжелые модули.
+
+    python scripts/bench_import.py [--runs N] [--budget-ms MS]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули, которые не должны загружаться при импорте точки входа
+HEAVY_MODULES = ["prettytable", "cProfile", "pstats", "threading",
+                 "src.primitive_db.engine"]
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import src.primitive_db.main
+elapsed = time.perf_counter() - start
+loaded = [name for name in {heavy!r} if name in sys.modules]
+print(elapsed, ",".join(loaded))
+"""
+
+
+def measure_once():
+    probe = PROBE.format(heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout.split()
+    elapsed = float(output[0])
+    loaded = output[1].split(",") if len(output) > 1 else []
+    return elapsed, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=30.0)
+    options = parser.parse_args()
+
+    timings = []
+    loaded = []
+    for _ in range(options.runs):
+        elapsed, loaded = measure_once()
+        timings.append(elapsed * 1000)
+
+    median = statistics.median(timings)
+    print(f"Импорт точки входа: медиана {median:.2f} мс, "
+          f"мин {min(timings):.2f} мс, макс {max(timings):.2f} мс "
+          f"({options.runs} запусков)")
+
+    failed = False
+    if loaded:
+        print(f"Ошибка: при запуске загружены тяжелые модули: {', '.join(loaded)}")
+        failed = True
+    if median > options.budget_ms:
+        print(f"Ошибка: медиана {median:.2f} мс превышает бюджет {options.budget_ms:.2f} мс")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
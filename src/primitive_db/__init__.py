@@ -1,17 +1,56 @@
 """Primitive Database System"""
-from .engine import welcome, run, list_tables, print_table_result
+import importlib
+
 from .main import main
-from .utils import (load_metadata, save_metadata, create_table, drop_table,
- load_table_data, save_table_data)
-from .core import insert, select, update, delete, validate_value, convert_value
-from .parser import parse_where, parse_set, parse_value, split_by_commas, parse_where_simple
-from .decorators import handle_db_errors, confirm_action, log_time
+
+# Модули подгружаются лениво (PEP 562): импорт пакета не тянет
+# engine, utils, core и их зависимости, пока к ним не обратились
+_LAZY_EXPORTS = {
+    'welcome': 'engine', 'run': 'engine', 'execute_command': 'engine',
+    'list_tables': 'engine', 'print_table_result': 'engine',
+    'load_metadata': 'utils', 'save_metadata': 'utils', 'create_table': 'utils',
+    'drop_table': 'utils', 'load_table_data': 'utils', 'iter_table_data': 'utils',
+    'save_table_data': 'utils',
+    'set_table_storage': 'utils', 'apply_table_delta': 'utils', 'partition_table': 'utils',
+    'table_segments': 'utils', 'table_snapshot_files': 'utils',
+    'insert': 'core', 'select': 'core', 'iter_select': 'core', 'update': 'core',
+    'delete': 'core',
+    'validate_value': 'core', 'convert_value': 'core',
+    'parse_where': 'parser', 'parse_set': 'parser', 'parse_value': 'parser',
+    'split_by_commas': 'parser', 'parse_where_simple': 'parser', 'parse_select': 'parser',
+    'iter_hash_join': 'core', 'build_hash_index': 'core', 'order_rows': 'core',
+    'iter_sorted': 'core',
+    'handle_db_errors': 'decorators', 'confirm_action': 'decorators',
+    'log_time': 'decorators',
+    'span': 'profiler', 'profile_command': 'profiler',
+    'compile_row_codec': 'codec', 'get_row_codec': 'codec',
+    'pin_snapshot': 'snapshot', 'read_manifest': 'snapshot',
+}
 
 __all__ = [
-    'welcome', 'run', 'main', 'list_tables', 'print_table_result',
+    'welcome', 'run', 'execute_command', 'main', 'list_tables', 'print_table_result',
     'load_metadata', 'save_metadata', 'create_table', 'drop_table', 'load_table_data',
-    'save_table_data',
-    'insert', 'select', 'update', 'delete', 'validate_value', 'convert_value',
+    'iter_table_data', 'save_table_data', 'set_table_storage', 'apply_table_delta',
+    'partition_table',
+    'table_segments', 'table_snapshot_files',
+    'insert', 'select', 'iter_select', 'update', 'delete', 'validate_value',
+    'convert_value',
     'parse_where', 'parse_set', 'parse_value', 'split_by_commas', 'parse_where_simple',
-    'handle_db_errors', 'confirm_action', 'log_time'
+    'parse_select', 'iter_hash_join', 'build_hash_index', 'order_rows', 'iter_sorted',
+    'handle_db_errors', 'confirm_action', 'log_time',
+    'span', 'profile_command', 'compile_row_codec', 'get_row_codec',
+    'pin_snapshot', 'read_manifest'
 ]
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
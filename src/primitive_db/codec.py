@@ -0,0 +1,108 @@
+from .cache import create_cacher
+
+# Скомпилированные кодеки таблиц; схема входит в ключ, поэтому
+# после изменения столбцов кодек компилируется заново
+codec_cache = create_cacher()
+
+
+def _type_error(col_name, col_type):
+    return ValueError(f"Неверный тип для столбца '{col_name}'. Ожидается {col_type}")
+
+
+def _convert_int(value, col_name):
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    raise _type_error(col_name, "int")
+
+
+def _convert_str(value, col_name):
+    if isinstance(value, str):
+        return value
+    raise _type_error(col_name, "str")
+
+
+def _convert_bool(value, col_name):
+    if isinstance(value, bool):
+        return value
+    if value in ("true", "1", 1):
+        return True
+    if value in ("false", "0", 0):
+        return False
+    raise _type_error(col_name, "bool")
+
+
+def _literal_int(value_str, col_name):
+    value_str = value_str.strip()
+    digits = value_str[1:] if value_str.startswith("-") else value_str
+    if digits.isdigit():
+        return int(value_str)
+    raise _type_error(col_name, "int")
+
+
+def _literal_str(value_str, col_name):
+    return value_str
+
+
+def _literal_bool(value_str, col_name):
+    value_str = value_str.strip().lower()
+    if value_str in ("true", "1"):
+        return True
+    if value_str in ("false", "0"):
+        return False
+    raise _type_error(col_name, "bool")
+
+
+# Конвертеры значений INSERT (те же правила, что validate_value + convert_value)
+VALUE_CONVERTERS = {"int": _convert_int, "str": _convert_str, "bool": _convert_bool}
+
+# Конвертеры литералов WHERE/SET из исходной строки
+LITERAL_CONVERTERS = {"int": _literal_int, "str": _literal_str, "bool": _literal_bool}
+
+
+def compile_row_codec(columns):
+    """
+    Компилирует кодек таблицы по списку столбцов.
+
+    Возвращает функцию, которая за один проход проверяет и конвертирует
+    значения новой записи (без ID). У функции есть метод convert_literal
+    для литералов WHERE/SET.
+    """
+    names = [col_name for col_name, _ in columns[1:]]  # Пропускаем ID
+    converters = [VALUE_CONVERTERS[col_type] for _, col_type in columns[1:]]
+    literal_converters = {col_name: LITERAL_CONVERTERS[col_type]
+                          for col_name, col_type in columns}
+    fields = list(zip(names, converters))
+    expected_count = len(fields)
+
+    def convert_row(values):
+        if len(values) != expected_count:
+            raise ValueError(f"Ожидалось {expected_count} значений, получено {len(values)}")
+        return {name: convert(value, name) for (name, convert), value in zip(fields, values)}
+
+    def convert_literal(field, value_str):
+        convert = literal_converters.get(field)
+        if convert is None:
+            raise ValueError(f"Столбец '{field}' не существует")
+        return convert(value_str, field)
+
+    convert_row.convert_literal = convert_literal
+    convert_row.columns = [col_name for col_name, _ in columns]
+    return convert_row
+
+
+def get_row_codec(metadata, table_name):
+    """
+    Возвращает кэшированный кодек таблицы.
+    """
+    return get_columns_codec(table_name, metadata["tables"][table_name]["columns"])
+
+
+def get_columns_codec(name, columns):
+    """
+    Возвращает кэшированный кодек для произвольного набора столбцов
+    (например, результата соединения таблиц).
+    """
+    schema = tuple((col_name, col_type) for col_name, col_type in columns)
+    return codec_cache((name, schema), lambda: compile_row_codec(columns))
@@ -1,9 +1,20 @@
 from .decorators import handle_db_errors, confirm_action, log_time
 from .cache import create_cacher
+from .codec import get_row_codec
+from .profiler import span
 
 # Создаем кэшер для операций select
 select_cache = create_cacher()
 
+# Хэш-индексы для соединений: (таблица, столбец) -> (сигнатура файлов, индекс)
+_hash_indexes = {}
+
+# Бюджет памяти сортировки в записях: больше - внешняя сортировка слиянием
+sort_settings = {"memory_rows": 100000}
+
+# Столбцы, в порядке которых записи уже лежат в файле (ID растет при вставке)
+SORTED_COLUMNS = ("ID",)
+
 
 @handle_db_errors
 def validate_value(value, expected_type):
@@ -43,68 +54,55 @@ def convert_value(value, expected_type):
 def insert(metadata, table_name, values):
     """
     Вставляет новую запись в таблицу.
+    
+    Returns:
+        dict: Добавленная запись
     """
     if "tables" not in metadata or table_name not in metadata["tables"]:
         raise KeyError(f"Таблица '{table_name}' не существует!")
     
-    table_info = metadata["tables"][table_name]
-    columns = table_info["columns"]
-    
-    expected_count = len(columns) - 1
-    if len(values) != expected_count:
-        raise ValueError(f"Ожидалось {expected_count} значений, получено {len(values)}")
-    
-    # Загружаем текущие данные таблицы
-    from .utils import load_table_data, save_table_data
-    table_data = load_table_data(table_name, metadata)
-    
-    # Генерируем новый ID
-    if table_data:
-        max_id = max(record.get("ID", 0) for record in table_data)
-        new_id = max_id + 1
-    else:
-        new_id = 1
-    
-    # Создаем новую запись
-    new_record = {"ID": new_id}
-    
-    # Валидируем и добавляем значения
-    for i, (col_name, col_type) in enumerate(columns[1:]):  # Пропускаем ID
-        value = values[i]
-        
-        # Валидация типа
-        if not validate_value(value, col_type):
-            raise ValueError(f"Неверный тип для столбца '{col_name}'. Ожидается {col_type}")
-        
-        # Конвертируем значение
-        new_record[col_name] = convert_value(value, col_type)
-    
-    # Добавляем запись в данные
-    table_data.append(new_record)
+    # Проверяем и конвертируем значения за один проход кодеком таблицы
+    values_row = get_row_codec(metadata, table_name)(values)
     
-    # Сохраняем данные
-    if save_table_data(table_name, table_data, metadata):
-        print(f"Запись успешно добавлена в таблицу '{table_name}' с ID={new_id}")
-        return table_data
+    # Сохраняем данные: запись дописывается в журнал изменений таблицы.
+    # ID назначается при записи под блокировкой, чтобы одновременные вставки
+    # не получили один и тот же ID
+    from .utils import apply_table_delta
+    entry = {"op": "insert", "row": values_row}
+    with span("save"):
+        saved = apply_table_delta(table_name, [entry], metadata)
+    if saved:
+        new_record = entry["row"]
+        print(f"Запись успешно добавлена в таблицу '{table_name}' с ID={new_record['ID']}")
+        return new_record
     else:
         raise Exception("Ошибка при сохранении данных")
 
-def _select_uncached(table_data, where_clause=None):
+def iter_select(table_data, where_clause=None):
     """
-    Внутренняя функция SELECT без кэширования.
+    Потоково выбирает записи, удовлетворяющие условию WHERE.
     """
     if where_clause is None:
-        return table_data
+        yield from table_data
+        return
     
-    filtered_data = []
     for record in table_data:
-        match = True
         for field, value in where_clause.items():
             if field not in record or record[field] != value:
-                match = False
                 break
-        if match:
-            filtered_data.append(record)
+        else:
+            yield record
+
+
+def _select_uncached(table_data, where_clause=None):
+    """
+    Внутренняя функция SELECT без кэширования.
+    """
+    if where_clause is None:
+        return table_data
+    
+    with span("filter"):
+        filtered_data = list(iter_select(table_data, where_clause))
     
     return filtered_data
 
@@ -115,8 +113,9 @@ def select(table_data, where_clause=None):
     """
     Выбирает записи из данных таблицы с кэшированием.
     """
-    cache_key = _create_cache_key(table_data, where_clause)
-    result = select_cache(cache_key, lambda: _select_uncached(table_data, where_clause))
+    with span("cache"):
+        cache_key = _create_cache_key(table_data, where_clause)
+        result = select_cache(cache_key, lambda: _select_uncached(table_data, where_clause))
     return result
 
 
@@ -135,29 +134,220 @@ def _create_cache_key(table_data, where_clause):
     return cache_key
 
 
+def build_hash_index(table_data, column):
+    """
+    Строит хэш-индекс по столбцу: значение -> список записей.
+    """
+    index = {}
+    for record in table_data:
+        if column in record:
+            index.setdefault(record[column], []).append(record)
+    return index
+
+
+def get_hash_index(table_name, table_data, column, signature=None):
+    """
+    Возвращает хэш-индекс таблицы по столбцу, переиспользуя построенный ранее,
+    пока сигнатура файлов таблицы не изменилась.
+    """
+    if signature is None:
+        return build_hash_index(table_data, column)
+    
+    cached = _hash_indexes.get((table_name, column))
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    
+    index = build_hash_index(table_data, column)
+    _hash_indexes[(table_name, column)] = (signature, index)
+    return index
+
+
+def _split_where(where_clause, table_names):
+    """
+    Раскладывает условие WHERE с полями table.col по таблицам.
+    """
+    side_where = {name: None for name in table_names}
+    for field, value in (where_clause or {}).items():
+        table_name, _, column = field.partition(".")
+        if table_name not in side_where:
+            raise ValueError(f"Столбец '{field}' не относится к соединяемым таблицам")
+        side_where[table_name] = {**(side_where[table_name] or {}), column: value}
+    return side_where
+
+
+def iter_hash_join(left_name, left_data, right_name, right_data, left_key, right_key,
+                   where_clause=None, signatures=None, sizes=None):
+    """
+    Потоково соединяет две таблицы по равенству столбцов (hash join).
+    
+    Условие WHERE (поля вида table.col) применяется к каждой таблице до соединения.
+    Хэш-индекс строится по меньшей таблице (готовый индекс переиспользуется,
+    и тогда таблица не читается вовсе), большая таблица читается потоком.
+    Записи результата имеют поля table.col.
+    
+    Args:
+        left_data, right_data: Записи таблиц (список или поток)
+        sizes (dict): Оценка объема таблиц для выбора стороны индекса;
+            без нее сравниваются длины списков
+    """
+    signatures = signatures or {}
+    side_where = _split_where(where_clause, (left_name, right_name))
+    
+    # Строим индекс по меньшей стороне
+    if sizes is not None:
+        build_left = sizes[left_name] < sizes[right_name]
+    else:
+        build_left = len(left_data) < len(right_data)
+    if build_left:
+        build_name, build_data, build_key = left_name, left_data, left_key
+        probe_name, probe_data, probe_key = right_name, right_data, right_key
+    else:
+        build_name, build_data, build_key = right_name, right_data, right_key
+        probe_name, probe_data, probe_key = left_name, left_data, left_key
+    
+    if side_where[build_name] is None:
+        index = get_hash_index(build_name, build_data, build_key, signatures.get(build_name))
+    else:
+        # Отфильтрованная сторона индексируется заново
+        index = build_hash_index(iter_select(build_data, side_where[build_name]), build_key)
+    
+    left_prefix, right_prefix = f"{left_name}.", f"{right_name}."
+    for probe_record in iter_select(probe_data, side_where[probe_name]):
+        if probe_key not in probe_record:
+            continue
+        for build_record in index.get(probe_record[probe_key], ()):
+            left_record, right_record = ((build_record, probe_record) if build_left
+                                         else (probe_record, build_record))
+            row = {left_prefix + field: value for field, value in left_record.items()}
+            row.update((right_prefix + field, value) for field, value in right_record.items())
+            yield row
+
+
+def _sort_key(column, descending=False):
+    """
+    Ключ сортировки по столбцу; записи без значения идут в конце
+    при любом направлении сортировки.
+    """
+    # При reverse=True порядок ключей обращается, поэтому и ранг пустых значений
+    null_rank = -1 if descending else 1
+
+    def key(record):
+        value = record.get(column)
+        return (null_rank, 0) if value is None else (0, value)
+    return key
+
+
+def _spill_run(records, key, descending):
+    """
+    Сортирует порцию записей и сбрасывает её во временный файл (JSON Lines).
+    """
+    import json
+    import tempfile
+
+    records.sort(key=key, reverse=descending)
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix=".run.jsonl",
+                                     delete=False) as file:
+        for record in records:
+            file.write(json.dumps(record, ensure_ascii=False))
+            file.write("\n")
+    return file.name
+
+
+def _read_run(path):
+    import json
+
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            yield json.loads(line)
+
+
+def iter_sorted(rows, column, descending=False, memory_rows=None):
+    """
+    Потоково сортирует записи по столбцу.
+    
+    Пока записей не больше бюджета памяти, сортирует в памяти; иначе
+    сбрасывает отсортированные порции во временные файлы и сливает их.
+    """
+    import heapq
+    import os
+
+    memory_rows = memory_rows or sort_settings["memory_rows"]
+    key = _sort_key(column, descending)
+    runs = []
+    chunk = []
+    try:
+        for record in rows:
+            chunk.append(record)
+            if len(chunk) >= memory_rows:
+                runs.append(_spill_run(chunk, key, descending))
+                chunk = []
+        chunk.sort(key=key, reverse=descending)
+        
+        if not runs:
+            yield from chunk
+            return
+        
+        yield from heapq.merge(*(_read_run(path) for path in runs), chunk,
+                               key=key, reverse=descending)
+    finally:
+        for path in runs:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def order_rows(rows, column, descending=False, limit=None, presorted=False):
+    """
+    Применяет ORDER BY и LIMIT к потоку записей.
+    
+    - presorted: записи уже упорядочены по столбцу, сортировка не нужна
+    - с LIMIT: ограниченная куча, O(n log k) времени и O(k) памяти
+    - без LIMIT: сортировка в пределах бюджета памяти или внешняя
+    """
+    import heapq
+    from itertools import islice
+
+    if column is None:
+        return rows if limit is None else islice(rows, limit)
+    
+    if presorted:
+        if not descending:
+            return rows if limit is None else islice(rows, limit)
+        if limit is not None:
+            # Последние k записей потока в обратном порядке: O(k) памяти
+            from collections import deque
+            return reversed(deque(rows, maxlen=limit))
+        return reversed(rows if isinstance(rows, list) else list(rows))
+    
+    if limit is not None:
+        top_k = heapq.nlargest if descending else heapq.nsmallest
+        return top_k(limit, rows, key=_sort_key(column, descending))
+    
+    return iter_sorted(rows, column, descending)
+
+
 @log_time
 @handle_db_errors
 def update(table_data, set_clause, where_clause):
     """
     Обновляет записи в данных таблицы.
+    
+    Returns:
+        list: Изменения {"op": "update", "ID": ..., "set": {...}} для
+        записей, значения которых действительно поменялись
     """
     updated_count = 0
+    delta = []
     
-    for record in table_data:
-        match = True
-        for field, value in where_clause.items():
-            if field not in record or record[field] != value:
-                match = False
-                break
-        
-        if match:
-            for field, new_value in set_clause.items():
-                if field in record and field != "ID":
-                    record[field] = new_value
+    with span("filter"):
+        for record in iter_select(table_data, where_clause):
+            changes = {field: new_value for field, new_value in set_clause.items()
+                       if field in record and field != "ID" and record[field] != new_value}
+            if changes:
+                delta.append({"op": "update", "ID": record["ID"], "set": changes})
             updated_count += 1
     
     print(f"Обновлено записей: {updated_count}")
-    return table_data
+    return delta
 
 
 @log_time
@@ -166,24 +356,16 @@ def update(table_data, set_clause, where_clause):
 def delete(table_data, where_clause):
     """
     Удаляет записи из данных таблицы.
-    """
-    filtered_data = []
-    deleted_count = 0
     
-    for record in table_data:
-        match = True
-        for field, value in where_clause.items():
-            if field not in record or record[field] != value:
-                match = False
-                break
-        
-        if match:
-            deleted_count += 1
-        else:
-            filtered_data.append(record)
+    Returns:
+        list: Изменения {"op": "delete", "ID": ...} для удаляемых записей
+    """
+    with span("filter"):
+        delta = [{"op": "delete", "ID": record["ID"]}
+                 for record in iter_select(table_data, where_clause)]
     
-    print(f"Удалено записей: {deleted_count}")
-    return filtered_data
+    print(f"Удалено записей: {len(delta)}")
+    return delta
 
 
 def clear_select_cache():
@@ -198,3 +380,14 @@ def get_select_cache_stats():
     Возвращает статистику кэша SELECT.
     """
     return select_cache.stats()
+
+
+def set_sort_memory(value):
+    """
+    Задает бюджет памяти сортировки (в записях). Возвращает True при успехе.
+    """
+    if not value.isdigit() or int(value) == 0:
+        print("Ошибка: sort_memory должен быть положительным целым числом")
+        return False
+    sort_settings["memory_rows"] = int(value)
+    return True
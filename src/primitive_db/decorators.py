@@ -1,6 +1,8 @@
 import time
 import functools
 
+from .output import status_stream
+
 
 def handle_db_errors(func):
     """
@@ -64,6 +66,7 @@ def log_time(func):
         end_time = time.monotonic()
         execution_time = end_time - start_time
         
-        print(f"Функция {func.__name__} выполнилась за {execution_time:.3f} секунд.")
+        print(f"Функция {func.__name__} выполнилась за {execution_time:.3f} секунд.",
+              file=status_stream())
         return result
     return wrapper
@@ -1,9 +1,19 @@
 import shlex
-from prettytable import PrettyTable
+from .profiler import span, span_iter, profile_command
 from .utils import (load_metadata, save_metadata, create_table, drop_table, 
-load_table_data, save_table_data)
-from .core import insert, select, update, delete, clear_select_cache
-from .parser import parse_where, parse_set
+load_table_data, iter_table_data, apply_table_delta, set_table_storage, partition_table,
+table_signature, table_snapshot_files, table_size_estimate)
+from .storage import get_storage_info, format_size
+from .core import (insert, select, iter_select, iter_hash_join, order_rows, update, delete,
+clear_select_cache, set_sort_memory, SORTED_COLUMNS)
+from .parser import parse_where, parse_set, parse_select
+from .codec import get_row_codec, get_columns_codec
+from .output import (output_settings, set_output_option, write_delimited,
+write_json_lines, write_table_pages)
+
+METADATA_FILE = "db_meta.json"
+TABLE_COMMANDS = {"list_tables", "create_table", "drop_table", "insert", "select",
+                  "update", "delete", "set_storage", "partition_table"}
 
 
 def list_tables(metadata):
@@ -16,6 +26,61 @@ def list_tables(metadata):
     for table_name, table_info in metadata["tables"].items():
         columns = [f"{col[0]}:{col[1]}" for col in table_info["columns"]]
         print(f"  {table_name}: {', '.join(columns)}")
+        manifest, segments = table_snapshot_files(table_name, metadata)
+        options = manifest["storage"]
+        description = (f"{options['layout']}, сжатие {options['compression']}, "
+                       f"версия {manifest['version']}")
+        
+        if "partitioning" not in manifest:
+            segment, data_file = segments[0]
+            print(f"    хранение: {description}, {format_file_info(data_file, options, segment)}")
+            print_storage_history(manifest)
+            continue
+        
+        print(f"    хранение: {description}, разделы по "
+              f"{manifest['partitioning']['size']} ID: {len(segments)}")
+        for partition, data_file in segments:
+            print(f"      раздел {partition['index']} (ID {partition['min_id']}-"
+                  f"{partition['max_id']}): {format_file_info(data_file, options, partition)}")
+        print_storage_history(manifest)
+
+
+def format_file_info(data_file, options, segment=None):
+    """Описывает файл данных: размер на диске, степень сжатия, время записи и чтения"""
+    info = get_storage_info(data_file, options, (segment or {}).get("write_stats"))
+    if info is None:
+        return "файл данных отсутствует"
+    
+    description = f"на диске {format_size(info['disk_bytes'])}"
+    if info["raw_bytes"] and info["disk_bytes"]:
+        ratio = info["raw_bytes"] / info["disk_bytes"]
+        description += f" (JSON {format_size(info['raw_bytes'])}, x{ratio:.1f})"
+    if info["log_bytes"]:
+        description += f", журнал изменений {format_size(info['log_bytes'])}"
+    if "write_seconds" in info:
+        description += f", запись {info['write_seconds']:.4f} с"
+    if "read_seconds" in info:
+        description += f", чтение {info['read_seconds']:.4f} с"
+    return description
+
+
+def print_storage_history(manifest):
+    """Сравнивает форматы хранения таблицы по замерам последней полной записи в каждом"""
+    history = manifest.get("storage_history", {})
+    if len(history) < 2 and not any("read_seconds" in stats for stats in history.values()):
+        return
+    
+    print("    форматы хранения (последняя полная перезапись):")
+    for key, stats in history.items():
+        layout, compression = key.split("/")
+        parts = []
+        if "disk_bytes" in stats:
+            parts.append(f"на диске {format_size(stats['disk_bytes'])}, "
+                         f"JSON {format_size(stats['raw_bytes'])}, "
+                         f"записей {stats['rows']}, запись {stats['write_seconds']:.4f} с")
+        if "read_seconds" in stats:
+            parts.append(f"чтение {stats['read_seconds']:.4f} с")
+        print(f"      {layout}, сжатие {compression}: {', '.join(parts)}")
 
 
 def welcome():
@@ -31,51 +96,62 @@ def welcome():
     print("<command> list_tables - показать все таблицы")
     print("<command> insert <table_name> <value1> <value2> ... - добавить запись")
     print("<command> select <table_name> [where условие] - выбрать записи")
+    print("<command> select <table_name> join <table2> on <table.col> = <table2.col>"
+    " [where <table.col = значение>] - соединить таблицы")
+    print("<command> select ... [order by <столбец> [asc|desc]] [limit <n>]"
+    " - сортировка и ограничение результата")
     print("<command> update <table_name> set <set_условие>"
     " [where <where_условие>] - обновить записи")
     print("<command> delete <table_name> [where <where_условие>] - удалить записи")
+    print("<command> profile [--sample] <command...> - выполнить команду"
+    " под профилировщиком")
+    print("<command> set_storage <table_name> <pretty|compact> [none|gzip|zstd]"
+    " - формат хранения таблицы")
+    print("<command> partition_table <table_name> <n> - разбить таблицу на разделы"
+    " по n ID (0 - один файл)")
+    print("<command> set format <table|tsv|csv|jsonl> - формат вывода")
+    print("<command> set page_size <n> - размер страницы таблицы")
+    print("<command> set sort_memory <n> - сколько записей сортировать в памяти")
 
 
-def print_table_result(table_data, columns):
+def print_table_result(table_data, columns, output_format=None):
     """
-    Выводит данные таблицы в красивом формате с помощью PrettyTable.
+    Выводит данные таблицы в выбранном формате.
+    
+    Таблица PrettyTable выводится страницами ограниченного размера,
+    форматы tsv, csv и jsonl пишутся потоково, запись за записью.
     
     Args:
-        table_data (list): Данные таблицы
+        table_data (iterable): Данные таблицы (список или поток записей)
         columns (list): Список столбцов в формате [("name", "type"), ...]
+        output_format (str): table, tsv, csv или jsonl (по умолчанию - текущая настройка)
     """
-    if not table_data:
+    if table_data is None:
         print("Нет данных для отображения")
         return
     
-    # Создаем таблицу
-    table = PrettyTable()
-    
-    # Устанавливаем заголовки
+    output_format = output_format or output_settings["format"]
     field_names = [col[0] for col in columns]
-    table.field_names = field_names
-    
-    # Добавляем данные
-    for record in table_data:
-        row = [record.get(field, "") for field in field_names]
-        table.add_row(row)
     
-    # Настраиваем внешний вид
-    table.align = "l"  # Выравнивание по левому краю
-    
-    print(table)
-    print(f"Всего записей: {len(table_data)}")
+    if output_format == "tsv":
+        write_delimited(table_data, field_names, "\t")
+    elif output_format == "csv":
+        write_delimited(table_data, field_names, ",")
+    elif output_format == "jsonl":
+        write_json_lines(table_data, field_names)
+    else:
+        count = write_table_pages(table_data, field_names, output_settings["page_size"])
+        if not count:
+            print("Нет данных для отображения")
+            return
+        print(f"Всего записей: {count}")
 
 
-def run():
+def run(profile_mode=None):
     """Главная функция с основным циклом программы"""
     welcome()
-    metadata_file = "db_meta.json"
     
     while True:
-        # Загружаем актуальные метаданные
-        metadata = load_metadata(metadata_file)
-        
         try:
             user_input = input("Введите команду: ").strip()
         except (EOFError, KeyboardInterrupt):
@@ -84,187 +160,368 @@ def run():
             
         if not user_input:
             continue
-            
-        # Разбираем введенную строку на команду и аргументы
-        args = shlex.split(user_input)
-        command = args[0].lower() if args else ""
         
-        if command == "exit":
-            print("Выход из программы. До свидания!")
+        if profile_mode:
+            label = user_input.split()[0].lower()
+            keep_running = profile_command(lambda: execute_command(user_input),
+                                           profile_mode, label=label)
+        else:
+            keep_running = execute_command(user_input)
+        
+        if not keep_running:
             break
-            
-        elif command == "help":
-            welcome()
-            
-        elif command == "list_tables":
-            list_tables(metadata)
-            
-        elif command == "create_table":
-            if len(args) < 3:
-                print("Ошибка: Используйте: create_table <table_name>"
-                " <column1:type1> [column2:type2 ...]")
-                continue
-                
-            table_name = args[1]
-            columns_spec = args[2:]
-            
-            # Парсим(извлекаем) спецификации столбцов
-            columns = []
-            for col_spec in columns_spec:
-                if ":" not in col_spec:
-                    print(f"Ошибка: Неверный формат столбца '{col_spec}'."
-                    " Используйте name:type")
-                    break
-                col_name, col_type = col_spec.split(":", 1)
-                columns.append((col_name, col_type))
+
+
+def run_once(args, profile_mode=None):
+    """Выполняет одну команду, переданную аргументами командной строки"""
+    user_input = shlex.join(args)
+    if profile_mode:
+        profile_command(lambda: execute_command(user_input), profile_mode,
+                        label=args[0].lower())
+    else:
+        execute_command(user_input)
+
+
+def execute_command(user_input, metadata_file=METADATA_FILE):
+    """
+    Выполняет одну команду.
+    
+    Returns:
+        bool: False, если нужно завершить работу программы
+    """
+    # Разбираем введенную строку на команду и аргументы
+    with span("parse"):
+        args = shlex.split(user_input)
+    command = args[0].lower() if args else ""
+    
+    if command == "profile":
+        # profile [--sample] <command...> - выполнить команду под профилировщиком
+        mode = "cprofile"
+        if len(args) > 1 and args[1] == "--sample":
+            mode = "sample"
+            args = args[1:]
+        if len(args) < 2:
+            print("Ошибка: Используйте: profile [--sample] <command...>")
+            return True
+        command_input = shlex.join(args[1:])
+        return profile_command(lambda: execute_command(command_input, metadata_file),
+                               mode, label=args[1].lower())
+    
+    if command == "exit":
+        print("Выход из программы. До свидания!")
+        return False
+    
+    if command == "help":
+        welcome()
+        return True
+    
+    if command == "set":
+        if len(args) != 3:
+            print("Ошибка: Используйте: set <format|page_size|sort_memory> <значение>")
+            return True
+        if args[1].lower() == "sort_memory":
+            applied = set_sort_memory(args[2])
+        else:
+            applied = set_output_option(args[1].lower(), args[2].lower())
+        if applied:
+            print(f"Настройка {args[1].lower()} = {args[2].lower()}")
+        return True
+    
+    if command not in TABLE_COMMANDS:
+        print(f"Неизвестная команда: '{command}'")
+        print("Введите 'help' для справки по командам")
+        return True
+    
+    # Метаданные читаются только для команд, которые работают с таблицами
+    with span("metadata"):
+        metadata = load_metadata(metadata_file)
+    
+    if command == "list_tables":
+        list_tables(metadata)
+    
+    elif command == "partition_table":
+        if len(args) != 3 or not args[2].isdigit():
+            print("Ошибка: Используйте: partition_table <table_name> <rows_per_partition>"
+            " (0 - один файл)")
+            return True
+        
+        new_metadata = partition_table(metadata, args[1], int(args[2]))
+        if new_metadata is not None:
+            with span("save"):
+                saved = save_metadata(metadata_file, new_metadata)
+            if saved:
+                print("Метаданные сохранены в db_meta.json")
             else:
-                new_metadata = create_table(metadata, table_name, columns)
-                if new_metadata is not None:
-                    if save_metadata(metadata_file, new_metadata):
-                        print("Метаданные сохранены в db_meta.json")
-                    else:
-                        print("Ошибка при сохранении метаданных")
-                    
-        elif command == "drop_table":
-            if len(args) != 2:
-                print("Ошибка: Используйте: drop_table <table_name>")
-                continue
-                
-            table_name = args[1]
-            new_metadata = drop_table(metadata, table_name)
+                print("Ошибка при сохранении метаданных")
+    
+    elif command == "set_storage":
+        if len(args) not in (3, 4):
+            print("Ошибка: Используйте: set_storage <table_name> <pretty|compact>"
+            " [none|gzip|zstd]")
+            return True
+        
+        compression = args[3].lower() if len(args) == 4 else "none"
+        new_metadata = set_table_storage(metadata, args[1], args[2].lower(), compression)
+        if new_metadata is not None:
+            with span("save"):
+                saved = save_metadata(metadata_file, new_metadata)
+            if saved:
+                print("Метаданные сохранены в db_meta.json")
+            else:
+                print("Ошибка при сохранении метаданных")
+        
+    elif command == "create_table":
+        if len(args) < 3:
+            print("Ошибка: Используйте: create_table <table_name>"
+            " <column1:type1> [column2:type2 ...]")
+            return True
+            
+        table_name = args[1]
+        columns_spec = args[2:]
+        
+        # Парсим(извлекаем) спецификации столбцов
+        columns = []
+        for col_spec in columns_spec:
+            if ":" not in col_spec:
+                print(f"Ошибка: Неверный формат столбца '{col_spec}'."
+                " Используйте name:type")
+                break
+            col_name, col_type = col_spec.split(":", 1)
+            columns.append((col_name, col_type))
+        else:
+            new_metadata = create_table(metadata, table_name, columns)
             if new_metadata is not None:
-                if save_metadata(metadata_file, new_metadata):
+                with span("save"):
+                    saved = save_metadata(metadata_file, new_metadata)
+                if saved:
                     print("Метаданные сохранены в db_meta.json")
                 else:
                     print("Ошибка при сохранении метаданных")
-        elif command == "insert":
-            if len(args) < 3:
-                print("Ошибка: Используйте: insert <table_name> <value1>"
-                " <value2> ...")
-                continue
-                
-            table_name = args[1]
-            values = args[2:]
-            
-            # Проверяем существование таблицы
-            if "tables" not in metadata or table_name not in metadata["tables"]:
-                print(f"Ошибка: Таблица '{table_name}' не существует!")
-                continue
-            
-            # Вставляем запись
-            new_data = insert(metadata, table_name, values)
-            if new_data is not None:
-                clear_select_cache()
-                print("Данные успешно добавлены")
-                
-        elif command == "select":
-            if len(args) < 2:
-                print("Ошибка: Используйте: select <table_name> [where условие]")
-                continue
                 
-            table_name = args[1]
-            where_clause = None
-            
-            # Проверяем существование таблицы
-            if "tables" not in metadata or table_name not in metadata["tables"]:
-                print(f"Ошибка: Таблица '{table_name}' не существует!")
-                continue
+    elif command == "drop_table":
+        if len(args) != 2:
+            print("Ошибка: Используйте: drop_table <table_name>")
+            return True
             
-            # Парсим условие WHERE если есть
-            if len(args) > 2 and args[2].lower() == "where":
-                where_str = " ".join(args[3:])
-                where_clause = parse_where(where_str)
-                if where_clause is None:
-                    continue
+        table_name = args[1]
+        new_metadata = drop_table(metadata, table_name)
+        if new_metadata is not None:
+            with span("save"):
+                saved = save_metadata(metadata_file, new_metadata)
+            if saved:
+                print("Метаданные сохранены в db_meta.json")
+            else:
+                print("Ошибка при сохранении метаданных")
+    elif command == "insert":
+        if len(args) < 3:
+            print("Ошибка: Используйте: insert <table_name> <value1>"
+            " <value2> ...")
+            return True
             
-            # Загружаем данные таблицы
-            table_data = load_table_data(table_name, metadata)
-            if table_data is None:
-                continue
+        table_name = args[1]
+        values = args[2:]
+        
+        # Проверяем существование таблицы
+        if "tables" not in metadata or table_name not in metadata["tables"]:
+            print(f"Ошибка: Таблица '{table_name}' не существует!")
+            return True
+        
+        # Вставляем запись
+        new_record = insert(metadata, table_name, values)
+        if new_record is not None:
+            clear_select_cache()
+            print("Данные успешно добавлены")
             
-            # Выполняем SELECT
-            result = select(table_data, where_clause)
+    elif command == "select":
+        if len(args) < 2:
+            print("Ошибка: Используйте: select <table_name> [join <table2> on"
+            " <table.col> = <table2.col>] [where условие]")
+            return True
+        
+        with span("parse"):
+            query = parse_select(args[1:])
+        if query is None:
+            return True
+        
+        table_name = query["table"]
+        join = query["join"]
+        table_names = [table_name] + ([join["table"]] if join else [])
+        
+        # Проверяем существование таблиц
+        for name in table_names:
+            if "tables" not in metadata or name not in metadata["tables"]:
+                print(f"Ошибка: Таблица '{name}' не существует!")
+                return True
+        
+        if join:
+            for name, key in ((table_name, join["left_key"]), (join["table"], join["right_key"])):
+                if key not in [col[0] for col in metadata["tables"][name]["columns"]]:
+                    print(f"Ошибка: Столбец '{key}' не существует в таблице '{name}'")
+                    return True
             
-            # Выводим результат в виде красивой таблицы
+            # Столбцы результата соединения имеют вид table.col
+            columns = [(f"{name}.{col_name}", col_type) for name in table_names
+                       for col_name, col_type in metadata["tables"][name]["columns"]]
+            codec = get_columns_codec(" join ".join(table_names), columns)
+        else:
             columns = metadata["tables"][table_name]["columns"]
-            print_table_result(result, columns)
-                    
-        elif command == "update":
-            if len(args) < 4 or args[2].lower() != "set":
-                print("Ошибка: Используйте: update <table_name> set <set_условие>"
-                " [where <where_условие>]")
-                continue
-                
-            table_name = args[1]
-            
-            # Проверяем существование таблицы
-            if "tables" not in metadata or table_name not in metadata["tables"]:
-                print(f"Ошибка: Таблица '{table_name}' не существует!")
-                continue
-            
-            set_str = " ".join(args[3:])
-            
-            # Разделяем SET и WHERE части
-            where_clause = None
-            if " where " in set_str.lower():
-                set_part, where_part = set_str.split(" where ", 1)
-                set_clause = parse_set(set_part)
-                where_clause = parse_where(where_part)
-            else:
-                set_clause = parse_set(set_str)
-            
-            if set_clause is None:
+            codec = get_row_codec(metadata, table_name)
+        
+        if query["order_by"] and query["order_by"][0] not in [col[0] for col in columns]:
+            print(f"Ошибка: Столбец '{query['order_by'][0]}' не существует")
+            return True
+        
+        # Парсим условие WHERE если есть
+        where_clause = None
+        if query["where"]:
+            with span("parse"):
+                where_clause = parse_where(query["where"], codec)
+            if where_clause is None:
+                return True
+        
+        order_column, descending = query["order_by"] or (None, False)
+        presorted = not join and order_column in SORTED_COLUMNS
+        
+        # Соединение, сортировка, LIMIT и потоковые форматы читают таблицы по разделам:
+        # бюджет sort_memory и LIMIT ограничивают память, а не только копии записей
+        stream = (join or output_settings["format"] != "table" or query["limit"] is not None
+                  or (order_column is not None and not presorted))
+        
+        # Загружаем данные таблиц
+        tables_data = []
+        for name in table_names:
+            if stream:
+                tables_data.append(iter_table_data(name, metadata,
+                                                   None if join else where_clause))
                 continue
-            
-            # Загружаем данные таблицы
-            table_data = load_table_data(table_name, metadata)
+            with span("table_load"):
+                table_data = load_table_data(name, metadata, None if join else where_clause)
             if table_data is None:
-                continue
-            
-            # Выполняем UPDATE
-            updated_data = update(table_data, set_clause, where_clause)
+                return True
+            tables_data.append(table_data)
+        
+        if join:
+            # Hash join: индекс по меньшей таблице (по оценке объема из манифеста),
+            # большая читается потоком; время соединения относится к фильтрации
+            signatures = {name: table_signature(name, metadata) for name in table_names}
+            sizes = {name: table_size_estimate(name, metadata) for name in table_names}
+            result = span_iter(
+                iter_hash_join(table_name, tables_data[0], join["table"], tables_data[1],
+                               join["left_key"], join["right_key"], where_clause,
+                               signatures, sizes),
+                "filter")
+        elif stream:
+            # Записи идут прямо из сканирования, без кэша select
+            result = iter_select(tables_data[0], where_clause)
+        else:
+            # Таблица выводится через кэшированный select
+            result = select(tables_data[0], where_clause)
+        
+        try:
+            # ORDER BY / LIMIT
+            if order_column is not None or query["limit"] is not None:
+                with span("sort"):
+                    result = order_rows(result, order_column, descending, query["limit"],
+                                        presorted)
             
-            # Сохраняем изменения
-            if save_table_data(table_name, updated_data, metadata):
-                print("Изменения сохранены")
-            else:
-                print("Ошибка при сохранении изменений")
+            # Выводим результат
+            with span("render"):
+                print_table_result(result, columns)
+        except FileNotFoundError as e:
+            print(f"Файл не найден: {e}")
                 
-        elif command == "delete":
-            if len(args) < 2:
-                print("Ошибка: Используйте: delete <table_name> [where <where_условие>]")
-                continue
-                
-            table_name = args[1]
-            
-            # Проверяем существование таблицы
-            if "tables" not in metadata or table_name not in metadata["tables"]:
-                print(f"Ошибка: Таблица '{table_name}' не существует!")
-                continue
+    elif command == "update":
+        if len(args) < 4 or args[2].lower() != "set":
+            print("Ошибка: Используйте: update <table_name> set <set_условие>"
+            " [where <where_условие>]")
+            return True
             
-            where_clause = None
-            
-            # Парсим условие WHERE если есть
-            if len(args) > 2 and args[2].lower() == "where":
-                where_str = " ".join(args[3:])
-                where_clause = parse_where(where_str)
+        table_name = args[1]
+        
+        # Проверяем существование таблицы
+        if "tables" not in metadata or table_name not in metadata["tables"]:
+            print(f"Ошибка: Таблица '{table_name}' не существует!")
+            return True
+        
+        set_str = " ".join(args[3:])
+        
+        # Разделяем SET и WHERE части; литералы конвертируются кодеком таблицы
+        where_clause = None
+        where_position = set_str.lower().find(" where ")
+        with span("parse"):
+            codec = get_row_codec(metadata, table_name)
+            if where_position != -1:
+                set_clause = parse_set(set_str[:where_position], codec)
+                where_clause = parse_where(set_str[where_position + 7:], codec)
+                # Неразобранное условие не должно превращаться в обновление всех записей
                 if where_clause is None:
-                    continue
-            
-            # Загружаем данные таблицы
-            table_data = load_table_data(table_name, metadata)
-            if table_data is None:
-                continue
+                    return True
+            else:
+                set_clause = parse_set(set_str, codec)
+        
+        if set_clause is None:
+            return True
+        
+        # Загружаем данные таблицы
+        with span("table_load"):
+            table_data = load_table_data(table_name, metadata, where_clause)
+        if table_data is None:
+            return True
+        
+        # Выполняем UPDATE
+        delta = update(table_data, set_clause, where_clause)
+        if delta is None:
+            return True
+        
+        # Сохраняем только измененные записи
+        with span("save"):
+            saved = apply_table_delta(table_name, delta, metadata)
+        if saved:
+            clear_select_cache()
+            print("Изменения сохранены")
+        else:
+            print("Ошибка при сохранении изменений")
             
-            # Выполняем DELETE
-            updated_data = delete(table_data, where_clause)
+    elif command == "delete":
+        if len(args) < 2:
+            print("Ошибка: Используйте: delete <table_name> [where <where_условие>]")
+            return True
             
-            # Сохраняем изменения
-            if save_table_data(table_name, updated_data, metadata):
-                print("Изменения сохранены")
-            else:
-                print("Ошибка при сохранении изменений")
-                
+        table_name = args[1]
+        
+        # Проверяем существование таблицы
+        if "tables" not in metadata or table_name not in metadata["tables"]:
+            print(f"Ошибка: Таблица '{table_name}' не существует!")
+            return True
+        
+        where_clause = None
+        
+        # Парсим условие WHERE если есть
+        if len(args) > 2 and args[2].lower() == "where":
+            where_str = " ".join(args[3:])
+            with span("parse"):
+                where_clause = parse_where(where_str, get_row_codec(metadata, table_name))
+            if where_clause is None:
+                return True
+        
+        # Загружаем данные таблицы
+        with span("table_load"):
+            table_data = load_table_data(table_name, metadata, where_clause)
+        if table_data is None:
+            return True
+        
+        # Выполняем DELETE
+        delta = delete(table_data, where_clause)
+        if delta is None:
+            return True
+        
+        # Сохраняем только удаленные записи
+        with span("save"):
+            saved = apply_table_delta(table_name, delta, metadata)
+        if saved:
+            clear_select_cache()
+            print("Изменения сохранены")
         else:
-            print(f"Неизвестная команда: '{command}'")
-            print("Введите 'help' для справки по командам")
+            print("Ошибка при сохранении изменений")
+    
+    return True
@@ -1,10 +1,62 @@
 #!/usr/bin/env python3
 
-from .engine import run
+import sys
 
+from .output import set_output_option
+from .profiler import PROFILE_MODES
 
-def main():
-    run()
+
+def main(argv=None):
+    """
+    Точка входа.
+
+    database [--profile[=<режим>]] [--format <формат>] - интерактивный режим
+    database [--profile[=<режим>]] [--format <формат>] <command...> - выполнить
+    одну команду и выйти
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # --profile / --profile=<режим> - профилировать каждую команду
+    # --format <формат> / --format=<формат> - формат вывода select
+    profile_mode = None
+    output_format = None
+    command_args = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == "--profile":
+            profile_mode = "cprofile"
+        elif arg.startswith("--profile="):
+            profile_mode = arg.split("=", 1)[1]
+        elif arg == "--format" and i + 1 < len(argv):
+            i += 1
+            output_format = argv[i]
+        elif arg.startswith("--format="):
+            output_format = arg.split("=", 1)[1]
+        elif arg.startswith("--"):
+            print(f"Неизвестный аргумент: '{arg}'")
+            return
+        else:
+            command_args = argv[i:]
+            break
+        i += 1
+
+    if profile_mode is not None and profile_mode not in PROFILE_MODES:
+        print(f"Ошибка: Неизвестный режим профилирования '{profile_mode}'. "
+              f"Допустимые режимы: {', '.join(PROFILE_MODES)}")
+        return
+
+    if output_format is not None and not set_output_option("format", output_format):
+        return
+
+    # Движок импортируется только при запуске, а не при импорте пакета
+    from .engine import run, run_once
+
+    if command_args:
+        run_once(command_args, profile_mode)
+    else:
+        run(profile_mode)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,99 @@
+import sys
+
+OUTPUT_FORMATS = ("table", "tsv", "csv", "jsonl")
+DEFAULT_PAGE_SIZE = 50
+
+# Текущие настройки вывода (меняются через --format и команду set)
+output_settings = {
+    "format": "table",
+    "page_size": DEFAULT_PAGE_SIZE,
+}
+
+
+def set_output_option(option, value):
+    """
+    Меняет настройку вывода. Возвращает True при успехе.
+    """
+    if option == "format":
+        if value not in OUTPUT_FORMATS:
+            print(f"Ошибка: Неизвестный формат '{value}'. "
+                  f"Допустимые форматы: {', '.join(OUTPUT_FORMATS)}")
+            return False
+        output_settings["format"] = value
+    elif option == "page_size":
+        if not value.isdigit() or int(value) == 0:
+            print("Ошибка: page_size должен быть положительным целым числом")
+            return False
+        output_settings["page_size"] = int(value)
+    else:
+        print(f"Ошибка: Неизвестная настройка '{option}'. "
+              "Доступные настройки: format, page_size")
+        return False
+    return True
+
+
+def status_stream():
+    """
+    Поток для служебных сообщений (замеры времени и т.п.): при потоковых
+    форматах stdout занят данными для конвейера, поэтому сообщения идут в stderr.
+    """
+    return sys.stdout if output_settings["format"] == "table" else sys.stderr
+
+
+def write_delimited(rows, field_names, delimiter):
+    """
+    Потоково выводит записи в формате CSV/TSV, строка за строкой.
+    """
+    import csv
+
+    writer = csv.writer(sys.stdout, delimiter=delimiter, lineterminator="\n")
+    writer.writerow(field_names)
+    count = 0
+    for record in rows:
+        writer.writerow([record.get(field, "") for field in field_names])
+        count += 1
+    return count
+
+
+def write_json_lines(rows, field_names):
+    """
+    Потоково выводит записи в формате JSON Lines, одна запись на строку.
+    """
+    import json
+
+    write = sys.stdout.write
+    count = 0
+    for record in rows:
+        row = {field: record.get(field) for field in field_names}
+        write(json.dumps(row, ensure_ascii=False))
+        write("\n")
+        count += 1
+    return count
+
+
+def write_table_pages(rows, field_names, page_size):
+    """
+    Выводит записи страницами PrettyTable ограниченного размера,
+    чтобы ширина столбцов не пересчитывалась по всему результату.
+    """
+    from prettytable import PrettyTable
+
+    def flush(page):
+        table = PrettyTable()
+        table.field_names = field_names
+        table.add_rows(page)
+        table.align = "l"  # Выравнивание по левому краю
+        print(table)
+
+    count = 0
+    page = []
+    for record in rows:
+        page.append([record.get(field, "") for field in field_names])
+        if len(page) >= page_size:
+            flush(page)
+            count += len(page)
+            page = []
+    if page:
+        flush(page)
+        count += len(page)
+    return count
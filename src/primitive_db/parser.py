@@ -1,11 +1,16 @@
 import shlex
 from .decorators import handle_db_errors
 
+SELECT_KEYWORDS = ("join", "on", "where", "order", "limit")
+# Ключевые слова, которые завершают условие WHERE
+WHERE_TERMINATORS = ("order", "limit")
+
 
 @handle_db_errors
-def parse_where(where_str):
+def parse_where(where_str, codec=None):
     """
     Парсит строку условия WHERE в словарь.
+    Если передан кодек таблицы, значение конвертируется по типу столбца.
     """
     if not where_str:
         return None
@@ -22,14 +27,15 @@ def parse_where(where_str):
         print(f"Ошибка: Неподдерживаемый оператор '{operator}'. Поддерживается только '='")
         return None
     
-    value = parse_value(value_str)
+    value = codec.convert_literal(field, value_str) if codec else parse_value(value_str)
     return {field: value}
 
 
 @handle_db_errors
-def parse_set(set_str):
+def parse_set(set_str, codec=None):
     """
     Парсит строку SET в словарь.
+    Если передан кодек таблицы, значения конвертируются по типам столбцов.
     """
     if not set_str:
         return None
@@ -45,7 +51,7 @@ def parse_set(set_str):
             return None
         
         field, _, value_str = sub_parts
-        value = parse_value(value_str)
+        value = codec.convert_literal(field, value_str) if codec else parse_value(value_str)
         result[field] = value
     
     return result
@@ -116,3 +122,74 @@ def parse_where_simple(where_str):
     
     value = parse_value(value_str)
     return {field: value}
+
+
+@handle_db_errors
+def parse_select(args):
+    """
+    Разбирает аргументы команды select (без самого слова select):
+    <table> [join <table2> on <table.col> = <table2.col>] [where <условие>]
+    [order by <col> [asc|desc]] [limit <n>]
+    """
+    if not args:
+        raise ValueError("Не указана таблица")
+    
+    result = {"table": args[0], "join": None, "where": None, "order_by": None,
+              "limit": None}
+    sections = {}
+    current = None
+    for arg in args[1:]:
+        keyword = arg.lower()
+        if keyword in SELECT_KEYWORDS and (current != "where" or keyword in WHERE_TERMINATORS):
+            if keyword in sections:
+                raise ValueError(f"Ключевое слово '{keyword}' указано дважды")
+            sections[keyword] = []
+            current = keyword
+        elif current is None:
+            raise ValueError(f"Неожиданный аргумент '{arg}'")
+        else:
+            sections[current].append(arg)
+    
+    if "where" in sections:
+        if not sections["where"]:
+            raise ValueError("Пустое условие WHERE")
+        result["where"] = " ".join(sections["where"])
+    
+    if "join" in sections or "on" in sections:
+        if len(sections.get("join", [])) != 1 or not sections.get("on"):
+            raise ValueError("Используйте: join <table2> on <table.col> = <table2.col>")
+        result["join"] = parse_join_condition(result["table"], sections["join"][0],
+                                              " ".join(sections["on"]))
+    
+    if "order" in sections:
+        order = [part.lower() if i != 1 else part for i, part in enumerate(sections["order"])]
+        if (len(order) not in (2, 3) or order[0] != "by"
+                or (len(order) == 3 and order[2] not in ("asc", "desc"))):
+            raise ValueError("Используйте: order by <col> [asc|desc]")
+        result["order_by"] = (order[1], len(order) == 3 and order[2] == "desc")
+    
+    if "limit" in sections:
+        if len(sections["limit"]) != 1 or not sections["limit"][0].isdigit():
+            raise ValueError("Используйте: limit <n>, где n - неотрицательное целое число")
+        result["limit"] = int(sections["limit"][0])
+    
+    return result
+
+
+def parse_join_condition(left_table, right_table, condition):
+    """
+    Разбирает условие соединения a.x = b.y в {"table": b, "left_key": x, "right_key": y}.
+    """
+    if condition.count("=") != 1:
+        raise ValueError(f"Неверное условие соединения '{condition}'. "
+                         "Используйте: table.col = table2.col")
+    
+    keys = {}
+    for side in condition.split("="):
+        table, _, column = side.strip().partition(".")
+        if not column or table not in (left_table, right_table) or table in keys:
+            raise ValueError(f"Неверное условие соединения '{condition}'. "
+                             "Используйте: table.col = table2.col")
+        keys[table] = column
+    
+    return {"table": right_table, "left_key": keys[left_table], "right_key": keys[right_table]}
@@ -0,0 +1,181 @@
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_DIR = "profiles"
+PROFILE_MODES = ("cprofile", "sample")
+SAMPLE_INTERVAL = 0.001
+
+# Фазы выполнения команды в порядке вывода
+PHASES = [
+    ("parse", "разбор команды"),
+    ("metadata", "загрузка метаданных"),
+    ("table_load", "загрузка таблицы"),
+    ("filter", "фильтрация"),
+    ("cache", "кэш"),
+    ("sort", "сортировка"),
+    ("save", "сохранение"),
+    ("render", "вывод"),
+]
+
+# Накопленное время фаз и стек открытых замеров (None - профилирование выключено)
+_phase_times = None
+_span_stack = []
+
+
+@contextmanager
+def span(phase):
+    """
+    Замеряет время фазы команды, если профилирование включено.
+    Время вложенных фаз вычитается из времени внешней.
+    """
+    if _phase_times is None:
+        yield
+        return
+
+    frame = [time.perf_counter(), 0.0]
+    _span_stack.append(frame)
+    try:
+        yield
+    finally:
+        _span_stack.pop()
+        elapsed = time.perf_counter() - frame[0]
+        _phase_times[phase] = _phase_times.get(phase, 0.0) + elapsed - frame[1]
+        if _span_stack:
+            _span_stack[-1][1] += elapsed
+
+
+def span_iter(iterable, phase):
+    """
+    Потоково отдает элементы, относя время получения каждого к фазе.
+    """
+    if _phase_times is None:
+        yield from iterable
+        return
+
+    iterator = iter(iterable)
+    while True:
+        with span(phase):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def print_phase_breakdown(phase_times, total_time):
+    """
+    Выводит разбивку времени выполнения команды по фазам.
+    """
+    print("Разбивка по фазам:")
+    labels = dict(PHASES)
+    accounted = 0.0
+    for phase, label in PHASES:
+        if phase in phase_times:
+            seconds = phase_times[phase]
+            accounted += seconds
+            print(f"  {label:<22} {seconds:.6f} с")
+    for phase, seconds in phase_times.items():
+        if phase not in labels:
+            accounted += seconds
+            print(f"  {phase:<22} {seconds:.6f} с")
+    print(f"  {'прочее':<22} {max(total_time - accounted, 0.0):.6f} с")
+    print(f"  {'итого':<22} {total_time:.6f} с")
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _run_sampled(func, stats_path):
+    """
+    Выполняет функцию под семплирующим профилировщиком.
+    Стеки сохраняются в формате collapsed stacks (для flamegraph).
+    """
+    import threading
+
+    samples = Counter()
+    target_id = threading.get_ident()
+    stop_event = threading.Event()
+
+    def sampler():
+        while not stop_event.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(target_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                samples[";".join(reversed(stack))] += 1
+
+    thread = threading.Thread(target=sampler, daemon=True)
+    thread.start()
+    try:
+        return func()
+    finally:
+        stop_event.set()
+        thread.join()
+        with open(stats_path, 'w', encoding='utf-8') as file:
+            for stack, count in samples.most_common():
+                file.write(f"{stack} {count}\n")
+
+        # Собственное время функций: вершины стеков
+        own_time = Counter()
+        for stack, count in samples.items():
+            own_time[stack.rsplit(";", 1)[-1]] += count
+        total = sum(own_time.values())
+        print(f"Собрано семплов: {total}")
+        for name, count in own_time.most_common(10):
+            print(f"  {count * 100 / total:5.1f}%  {name}")
+
+
+def profile_command(func, mode="cprofile", label="command"):
+    """
+    Выполняет команду под профилировщиком, сохраняет файл статистики
+    и выводит разбивку времени по фазам.
+    """
+    global _phase_times
+
+    if mode not in PROFILE_MODES:
+        print(f"Ошибка: Неизвестный режим профилирования '{mode}'. "
+              f"Допустимые режимы: {', '.join(PROFILE_MODES)}")
+        return True
+
+    # Команда уже выполняется под профилировщиком
+    if _phase_times is not None:
+        return func()
+
+    # Профилировщики импортируются только при включенном профилировании
+    import cProfile
+    import pstats
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    extension = "prof" if mode == "cprofile" else "folded"
+    # Метка попадает в имя файла статистики: допускаются только латиница, цифры и "_"
+    if not (label and label.isascii() and label.replace("_", "").isalnum()):
+        label = "command"
+    stats_path = os.path.join(PROFILE_DIR, f"{label}_{stamp}.{extension}")
+
+    _phase_times = {}
+    _span_stack.clear()
+    profiler = cProfile.Profile() if mode == "cprofile" else None
+    start_time = time.perf_counter()
+    try:
+        if profiler is not None:
+            result = profiler.runcall(func)
+        else:
+            result = _run_sampled(func, stats_path)
+    finally:
+        total_time = time.perf_counter() - start_time
+        phase_times, _phase_times = _phase_times, None
+        if profiler is not None:
+            profiler.dump_stats(stats_path)
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(10)
+        print_phase_breakdown(phase_times, total_time)
+        print(f"Статистика профилирования сохранена в {stats_path}")
+
+    return result
@@ -0,0 +1,269 @@
+import itertools
+import json
+import os
+import re
+from contextlib import contextmanager
+
+from .storage import FILE_EXTENSIONS, LOG_EXTENSION, log_file_path, get_storage_options
+
+MANIFEST_EXTENSION = ".manifest.json"
+LOCK_EXTENSION = ".lock"
+PINS_DIR = ".pins"
+
+# Сколько раз читатель перечитывает манифест, если версия сменилась во время закрепления
+PIN_RETRIES = 10
+
+_pin_counter = itertools.count()
+
+
+def _data_dir(table_info):
+    return os.path.dirname(table_info["data_file"]) or "data"
+
+
+def _table_name(table_info):
+    base = os.path.basename(table_info["data_file"])
+    for extension in sorted(FILE_EXTENSIONS.values(), key=len, reverse=True):
+        if base.endswith(extension):
+            return base[:-len(extension)]
+    return base
+
+
+def manifest_path(table_info):
+    """
+    Путь к манифесту таблицы: data/<table>.manifest.json.
+    """
+    return os.path.join(_data_dir(table_info), _table_name(table_info) + MANIFEST_EXTENSION)
+
+
+def versioned_path(data_file, generation):
+    """
+    Физический файл сегмента для поколения generation (0 - исходное имя файла).
+    """
+    if not generation:
+        return data_file
+    for extension in sorted(FILE_EXTENSIONS.values(), key=len, reverse=True):
+        if data_file.endswith(extension):
+            return f"{data_file[:-len(extension)]}.v{generation}{extension}"
+    return f"{data_file}.v{generation}"
+
+
+def segment_files(segment):
+    """
+    Физические пути основного файла и журнала сегмента из манифеста.
+    """
+    base = versioned_path(segment["file"], segment["generation"])
+    return base, log_file_path(base)
+
+
+def read_manifest(table_info, segments):
+    """
+    Читает манифест таблицы: номер версии, параметры хранения, разбиение
+    на разделы и зафиксированное состояние сегментов (поколение файла
+    и длина журнала). Если манифеста еще нет, состояние строится
+    по метаданным (версия 0, журнал читается целиком).
+    """
+    try:
+        with open(manifest_path(table_info), 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        manifest = {
+            "version": 0,
+            "segments": [{**segment, "generation": 0, "log_bytes": None}
+                         for segment in segments],
+        }
+    
+    if "storage" not in manifest:
+        # Таблица еще не записывалась с параметрами в манифесте - берем их из метаданных
+        manifest["storage"] = get_storage_options(table_info)
+        if "partitioning" in table_info:
+            manifest["partitioning"] = table_info["partitioning"]
+    return manifest
+
+
+def _write_json_atomic(path, data):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temp_path, path)
+
+
+def _lock_file(lock_file):
+    """
+    Захватывает эксклюзивную блокировку файла: fcntl.flock на POSIX,
+    msvcrt.locking первого байта на Windows.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lambda: fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    try:
+        import msvcrt
+    except ImportError:
+        raise RuntimeError("Блокировка файлов не поддерживается на этой платформе: "
+                           "одновременная запись в таблицы небезопасна")
+
+    # LK_LOCK ждет около 10 секунд и сдается - ждем, пока писатель не освободит таблицу
+    while True:
+        lock_file.seek(0)
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            break
+        except OSError:
+            continue
+
+    def unlock():
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+    return unlock
+
+
+@contextmanager
+def write_lock(table_info):
+    """
+    Блокировка писателей таблицы. Читатели её не берут и не ждут.
+    """
+    os.makedirs(_data_dir(table_info), exist_ok=True)
+    lock_path = os.path.join(_data_dir(table_info), _table_name(table_info) + LOCK_EXTENSION)
+    with open(lock_path, 'a+') as lock_file:
+        unlock = _lock_file(lock_file)
+        try:
+            yield
+        finally:
+            unlock()
+
+
+def _pins_dir(table_info):
+    return os.path.join(_data_dir(table_info), PINS_DIR)
+
+
+@contextmanager
+def pin_snapshot(table_info, segments):
+    """
+    Закрепляет текущую версию таблицы на время чтения.
+
+    Пока версия закреплена, её файлы не удаляются сборщиком мусора,
+    даже если писатели зафиксировали более новые версии.
+    """
+    pins_dir = _pins_dir(table_info)
+    os.makedirs(pins_dir, exist_ok=True)
+    pin_path = os.path.join(pins_dir, f"{_table_name(table_info)}.{os.getpid()}."
+                                      f"{next(_pin_counter)}.pin")
+
+    manifest = read_manifest(table_info, segments)
+    for _ in range(PIN_RETRIES):
+        files = [path for segment in manifest["segments"] for path in segment_files(segment)]
+        _write_json_atomic(pin_path, {"version": manifest["version"], "files": files})
+        # Если версия сменилась до закрепления, её файлы уже могли удалить
+        current = read_manifest(table_info, segments)
+        if current["version"] == manifest["version"]:
+            break
+        manifest = current
+
+    try:
+        yield manifest
+    finally:
+        if os.path.exists(pin_path):
+            os.remove(pin_path)
+
+
+def commit_manifest(table_info, manifest):
+    """
+    Фиксирует новую версию таблицы атомарной заменой манифеста
+    и удаляет файлы версий, которые больше никто не читает.
+    Вызывается под write_lock.
+    """
+    manifest["version"] += 1
+    _write_json_atomic(manifest_path(table_info), manifest)
+    collect_garbage(table_info, manifest)
+    return manifest["version"]
+
+
+def _process_alive(pid):
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _pinned_files(table_info):
+    """
+    Файлы, которые читают активные читатели. Закрепления умерших процессов удаляются.
+    """
+    pins_dir = _pins_dir(table_info)
+    prefix = _table_name(table_info) + "."
+    pinned = set()
+    if not os.path.isdir(pins_dir):
+        return pinned
+
+    for name in os.listdir(pins_dir):
+        if not name.startswith(prefix) or not name.endswith(".pin"):
+            continue
+        path = os.path.join(pins_dir, name)
+        pid = name[len(prefix):].split(".", 1)[0]
+        if pid.isdigit() and not _process_alive(int(pid)):
+            os.remove(path)
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                pinned.update(json.load(file)["files"])
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+    return pinned
+
+
+def table_file_pattern(table_name):
+    """
+    Регулярное выражение для всех файлов данных и журналов таблицы
+    (любых разделов и поколений).
+    """
+    extensions = "|".join(re.escape(ext) for ext in FILE_EXTENSIONS.values())
+    return re.compile(rf"^{re.escape(table_name)}(\.p\d+)?(\.v\d+)?"
+                      rf"({extensions}|{re.escape(LOG_EXTENSION)})$")
+
+
+def collect_garbage(table_info, manifest):
+    """
+    Удаляет файлы сегментов, не входящие ни в текущую, ни в закрепленные версии.
+    """
+    data_dir = _data_dir(table_info)
+    keep = {os.path.normpath(path) for segment in manifest["segments"]
+            for path in segment_files(segment)}
+    keep.update(os.path.normpath(path) for path in _pinned_files(table_info))
+
+    pattern = table_file_pattern(_table_name(table_info))
+    for name in os.listdir(data_dir):
+        path = os.path.normpath(os.path.join(data_dir, name))
+        if pattern.match(name) and path not in keep:
+            os.remove(path)
+
+
+def remove_table_files(table_info):
+    """
+    Удаляет все файлы таблицы: сегменты всех версий, манифест, блокировку и закрепления.
+    """
+    data_dir = _data_dir(table_info)
+    table_name = _table_name(table_info)
+    pattern = table_file_pattern(table_name)
+    removed = []
+    if os.path.isdir(data_dir):
+        for name in os.listdir(data_dir):
+            if pattern.match(name) or name in (table_name + MANIFEST_EXTENSION,
+                                               table_name + LOCK_EXTENSION):
+                os.remove(os.path.join(data_dir, name))
+                removed.append(os.path.join(data_dir, name))
+
+    pins_dir = _pins_dir(table_info)
+    if os.path.isdir(pins_dir):
+        for name in os.listdir(pins_dir):
+            if name.startswith(table_name + "."):
+                os.remove(os.path.join(pins_dir, name))
+    return removed
@@ -0,0 +1,283 @@
+import json
+import os
+import time
+
+STORAGE_LAYOUTS = ("pretty", "compact")
+COMPRESSIONS = ("none", "gzip", "zstd")
+FILE_EXTENSIONS = {"none": ".json", "gzip": ".json.gz", "zstd": ".json.zst"}
+DEFAULT_STORAGE = {"layout": "pretty", "compression": "none"}
+LOG_EXTENSION = ".log"
+
+# Журнал сворачивается в основной файл, когда становится больше него
+# (но не раньше, чем вырастет до этого размера)
+LOG_COMPACT_MIN_BYTES = 64 * 1024
+
+# Замеры последних чтений и записей файлов данных в текущем сеансе
+storage_stats = {}
+
+
+def get_storage_options(table_info):
+    """
+    Возвращает параметры хранения таблицы (для старых таблиц - по умолчанию).
+    """
+    return {**DEFAULT_STORAGE, **table_info.get("storage", {})}
+
+
+def data_file_path(data_dir, table_name, options):
+    """
+    Формирует путь к файлу данных с расширением, зависящим от сжатия.
+    """
+    return f"{data_dir}/{table_name}{FILE_EXTENSIONS[options['compression']]}"
+
+
+def log_file_path(data_file):
+    """
+    Путь к журналу изменений таблицы: data/<table>.log рядом с файлом данных.
+    """
+    for extension in sorted(FILE_EXTENSIONS.values(), key=len, reverse=True):
+        if data_file.endswith(extension):
+            return data_file[:-len(extension)] + LOG_EXTENSION
+    return data_file + LOG_EXTENSION
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("Для сжатия zstd установите пакет 'zstandard'")
+    return zstandard
+
+
+def check_compression(compression):
+    """
+    Проверяет, что сжатие поддерживается в текущем окружении.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Недопустимое сжатие '{compression}'. "
+                         f"Допустимые значения: {', '.join(COMPRESSIONS)}")
+    if compression == "zstd":
+        _zstd()
+
+
+def _encode_json(data, options):
+    if options["layout"] == "compact":
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    else:
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+    return text.encode("utf-8")
+
+
+def _compress(raw, options):
+    if options["compression"] == "gzip":
+        import gzip
+        return gzip.compress(raw, compresslevel=6)
+    if options["compression"] == "zstd":
+        return _zstd().ZstdCompressor().compress(raw)
+    return raw
+
+
+def encode_table(data, options):
+    """
+    Сериализует данные таблицы в байты согласно параметрам хранения.
+    """
+    return _compress(_encode_json(data, options), options)
+
+
+def decode_table(raw, options):
+    """
+    Восстанавливает данные таблицы из байтов файла.
+    """
+    if options["compression"] == "gzip":
+        import gzip
+        raw = gzip.decompress(raw)
+    elif options["compression"] == "zstd":
+        raw = _zstd().ZstdDecompressor().decompress(raw)
+    return json.loads(raw)
+
+
+def write_table_file(path, data, options):
+    """
+    Записывает данные таблицы в файл и запоминает размер и время записи.
+    
+    Returns:
+        dict: Замеры записи: размер на диске, размер JSON без сжатия, время
+    """
+    start_time = time.perf_counter()
+    raw = _encode_json(data, options)
+    encoded = _compress(raw, options)
+    # Пишем во временный файл и атомарно подменяем, чтобы не оставить
+    # наполовину записанный файл данных
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(encoded)
+    os.replace(temp_path, path)
+    stats = {"bytes_written": len(encoded), "raw_bytes": len(raw),
+             "write_seconds": time.perf_counter() - start_time}
+    storage_stats.setdefault(path, {}).update(stats)
+    return stats
+
+
+def read_table_file(path, options):
+    """
+    Читает данные таблицы из файла и запоминает время чтения.
+    """
+    start_time = time.perf_counter()
+    with open(path, 'rb') as file:
+        data = decode_table(file.read(), options)
+    storage_stats.setdefault(path, {})["read_seconds"] = time.perf_counter() - start_time
+    return data
+
+
+def append_log(path, entries, committed_bytes=None):
+    """
+    Дописывает записи изменений в журнал (JSON Lines).
+    
+    Если задан committed_bytes, всё, что записано после зафиксированной длины
+    (незавершенная запись упавшего писателя), отбрасывается.
+    
+    Returns:
+        int: Длина журнала после записи
+    """
+    start_time = time.perf_counter()
+    raw = "".join(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+                  for entry in entries).encode("utf-8")
+    with open(path, 'ab') as file:
+        if committed_bytes is not None:
+            file.truncate(committed_bytes)
+        elif file.tell() and not _ends_with_newline(path):
+            # Обрезаем недописанную строку, оставшуюся после сбоя прошлой записи
+            with open(path, 'rb') as source:
+                content = source.read()
+            file.truncate(content.rfind(b"\n") + 1)
+        file.seek(0, os.SEEK_END)
+        file.write(raw)
+        size = file.tell()
+    storage_stats.setdefault(path, {}).update(
+        bytes_written=len(raw), write_seconds=time.perf_counter() - start_time)
+    return size
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b"\n"
+
+
+def read_log(path, length=None):
+    """
+    Читает записи журнала изменений (только первые length байт, если задано).
+    Недописанная последняя строка игнорируется.
+    """
+    if not os.path.exists(path):
+        return []
+
+    with open(path, 'rb') as file:
+        content = file.read() if length is None else file.read(length)
+
+    entries = []
+    for line in content.split(b"\n"):
+        if not line:
+            continue
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            break
+    return entries
+
+
+def apply_log(data, entries):
+    """
+    Применяет записи журнала к данным таблицы.
+    Повторное применение безопасно: вставка существующего ID пропускается.
+    """
+    if not entries:
+        return data
+
+    positions = {record["ID"]: i for i, record in enumerate(data)}
+    has_deleted = False
+    for entry in entries:
+        op = entry["op"]
+        if op == "insert":
+            record_id = entry["row"]["ID"]
+            if record_id not in positions or data[positions[record_id]] is None:
+                positions[record_id] = len(data)
+                data.append(entry["row"])
+            continue
+
+        position = positions.get(entry["ID"])
+        if position is None or data[position] is None:
+            continue
+        if op == "update":
+            data[position].update(entry["set"])
+        elif op == "delete":
+            data[position] = None
+            has_deleted = True
+
+    if has_deleted:
+        data = [record for record in data if record is not None]
+    return data
+
+
+def log_needs_compaction(data_file):
+    """
+    Проверяет, пора ли свернуть журнал изменений в основной файл.
+    """
+    log_path = log_file_path(data_file)
+    if not os.path.exists(log_path):
+        return False
+    log_size = os.path.getsize(log_path)
+    data_size = os.path.getsize(data_file) if os.path.exists(data_file) else 0
+    return log_size > max(LOG_COMPACT_MIN_BYTES, data_size)
+
+
+def _uncompressed_size(path, options, disk_size):
+    """
+    Размер несжатого JSON по заголовкам файла, без распаковки.
+    """
+    if options["compression"] == "gzip":
+        # Последние 4 байта gzip - размер исходных данных по модулю 2**32
+        with open(path, 'rb') as file:
+            file.seek(-4, os.SEEK_END)
+            return int.from_bytes(file.read(4), "little")
+    if options["compression"] == "zstd":
+        try:
+            zstandard = _zstd()
+        except ValueError:
+            return None
+        with open(path, 'rb') as file:
+            size = zstandard.frame_content_size(file.read(18))
+        return size if size >= 0 else None
+    return disk_size
+
+
+def get_storage_info(path, options, saved_stats=None):
+    """
+    Возвращает размер файла на диске, размер без сжатия и замеры времени.
+    
+    Args:
+        saved_stats (dict): Замеры, сохраненные при записи файла (например,
+            в манифесте таблицы); замеры текущего сеанса их дополняют
+    """
+    if not os.path.exists(path):
+        return None
+
+    disk_size = os.path.getsize(path)
+    info = {"disk_bytes": disk_size, "raw_bytes": None, **(saved_stats or {})}
+    if disk_size and info["raw_bytes"] is None:
+        info["raw_bytes"] = _uncompressed_size(path, options, disk_size)
+    info.update(storage_stats.get(path, {}))
+
+    log_path = log_file_path(path)
+    info["log_bytes"] = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+    return info
+
+
+def format_size(size):
+    """
+    Форматирует размер в байтах в читаемый вид.
+    """
+    for unit in ("Б", "КБ", "МБ"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "Б" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
@@ -1,6 +1,13 @@
 import json
 import os
+import time
 from .decorators import handle_db_errors, confirm_action, log_time
+from .profiler import span
+from .storage import (STORAGE_LAYOUTS, DEFAULT_STORAGE, data_file_path,
+get_storage_info, check_compression, read_table_file, write_table_file, log_file_path, append_log, read_log,
+apply_log, log_needs_compaction)
+from .snapshot import (manifest_path, segment_files, read_manifest, pin_snapshot, write_lock,
+commit_manifest, remove_table_files)
 
 
 @log_time
@@ -36,8 +43,12 @@ def save_metadata(filepath, data):
         if directory:  # Только если путь содержит директории
             os.makedirs(directory, exist_ok=True)
         
-        with open(filepath, 'w', encoding='utf-8') as file:
+        # Пишем во временный файл и атомарно подменяем: читатели не увидят
+        # наполовину записанные метаданные
+        temp_path = f"{filepath}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
             json.dump(data, file, ensure_ascii=False, indent=4)
+        os.replace(temp_path, filepath)
         print(f"Метаданные успешно сохранены в {filepath}")
         return True
     except Exception as e:
@@ -61,15 +72,14 @@ def create_table(metadata, table_name, columns):
     
     columns_with_id = [("ID", "int")] + columns
     data_dir = "data"
-    data_file = f"{data_dir}/{table_name}.json"
+    data_file = data_file_path(data_dir, table_name, DEFAULT_STORAGE)
     
     # Создаем директорию data, если её нет
     os.makedirs(data_dir, exist_ok=True)
     
     # Инициализируем файл данных пустым списком
     try:
-        with open(data_file, 'w', encoding='utf-8') as file:
-            json.dump([], file, ensure_ascii=False, indent=2)
+        write_table_file(data_file, [], DEFAULT_STORAGE)
     except Exception as e:
         raise Exception(f"Ошибка при создании файла данных {data_file}: {e}")
     
@@ -100,14 +110,12 @@ def drop_table(metadata, table_name):
     if "tables" not in metadata or table_name not in metadata["tables"]:
         raise KeyError(f"Таблица '{table_name}' не существует!")
     
-    # Удаляем файл с данными
-    data_file = metadata["tables"][table_name]["data_file"]
+    # Удаляем файлы с данными (все разделы и версии таблицы), журналы и манифест
     try:
-        if os.path.exists(data_file):
-            os.remove(data_file)
+        for data_file in remove_table_files(metadata["tables"][table_name]):
             print(f"Файл данных {data_file} удален")
     except Exception as e:
-        print(f"Ошибка при удалении файла данных {data_file}: {e}")
+        print(f"Ошибка при удалении файлов данных таблицы '{table_name}': {e}")
     
     # Удаляем таблицу из метаданных
     del metadata["tables"][table_name]
@@ -120,46 +128,430 @@ def drop_table(metadata, table_name):
     return metadata
 
 
+def table_segments(table_info):
+    """
+    Сегменты таблицы по метаданным, пока у таблицы нет манифеста: единственный файл
+    данных (или список разделов в метаданных таблиц, разбитых до появления манифеста).
+    
+    Разделы таблицы с манифестом хранятся только в нем; в метаданных остается
+    лишь схема разбиения (partitioning).
+    """
+    if "partitions" in table_info:
+        return table_info["partitions"]
+    return [{"file": table_info["data_file"]}]
+
+
+def _read_table_manifest(table_info):
+    return read_manifest(table_info, table_segments(table_info))
+
+
+def _partition_entry(data_dir, table_name, options, size, index):
+    """
+    Описание раздела с номером index: файл и диапазон ID.
+    """
+    return {
+        "index": index,
+        "file": data_file_path(data_dir, f"{table_name}.p{index}", options),
+        "min_id": index * size + 1,
+        "max_id": (index + 1) * size,
+    }
+
+
+def _segment_for_id(table_name, table_info, manifest, record_id, create=False):
+    """
+    Находит в манифесте сегмент, в котором хранится запись с данным ID.
+    При create=True недостающий раздел создается (пустым файлом нового поколения).
+    """
+    if "partitioning" not in manifest:
+        return manifest["segments"][0]
+    
+    for segment in manifest["segments"]:
+        if segment["min_id"] <= record_id <= segment["max_id"]:
+            return segment
+    if not create:
+        return None
+    
+    options = manifest["storage"]
+    size = manifest["partitioning"]["size"]
+    partition = _partition_entry(os.path.dirname(table_info["data_file"]) or "data",
+                                 table_name, options, size, (record_id - 1) // size)
+    segment = {**partition, "generation": manifest["version"] + 1, "log_bytes": 0}
+    _write_segment(segment, [], options)
+    
+    manifest["segments"].append(segment)
+    manifest["segments"].sort(key=lambda item: item["index"])
+    print(f"Создан раздел {partition['file']} (ID {partition['min_id']}-{partition['max_id']})")
+    return segment
+
+
+def _load_segment(segment, options):
+    """
+    Загружает сегмент в зафиксированном состоянии: основной файл его поколения
+    и журнал изменений до зафиксированной длины.
+    """
+    data_file, log_file = segment_files(segment)
+    if not os.path.exists(data_file):
+        raise FileNotFoundError(f"Файл данных {data_file} не существует")
+    return apply_log(read_table_file(data_file, options),
+                     read_log(log_file, segment["log_bytes"]))
+
+
+def _write_segment(segment, rows, options):
+    """
+    Записывает основной файл сегмента и сохраняет в сегменте замеры записи,
+    чтобы list_tables показывал их и в других сеансах.
+    """
+    stats = write_table_file(segment_files(segment)[0], rows, options)
+    segment["write_stats"] = {"raw_bytes": stats["raw_bytes"],
+                              "write_seconds": round(stats["write_seconds"], 6)}
+    return stats
+
+
+def _storage_key(options):
+    return f"{options['layout']}/{options['compression']}"
+
+
+def _load_manifest_data(manifest):
+    """
+    Загружает все сегменты версии таблицы, описанной манифестом.
+    Время чтения запоминается в истории форматов хранения таблицы.
+    """
+    start_time = time.perf_counter()
+    data = []
+    for segment in manifest["segments"]:
+        data.extend(_load_segment(segment, manifest["storage"]))
+    history = manifest.setdefault("storage_history", {})
+    history.setdefault(_storage_key(manifest["storage"]), {})["read_seconds"] = round(
+        time.perf_counter() - start_time, 6)
+    return data
+
+
+def _max_record_id(manifest):
+    """
+    Максимальный ID в версии таблицы: разделы читаются с конца, обычно только последний.
+    """
+    for segment in reversed(manifest["segments"]):
+        records = _load_segment(segment, manifest["storage"])
+        if records:
+            return max(record.get("ID", 0) for record in records)
+    return 0
+
+
+def _rewrite_table(table_name, table_info, manifest, data, options, partitioning=None):
+    """
+    Записывает все сегменты таблицы новым поколением файлов с заданными параметрами
+    хранения и разбиения и фиксирует новую версию. Вызывается под write_lock.
+    
+    В метаданных таблицы обновляются файл, параметры хранения и схема разбиения;
+    список разделов хранится только в манифесте. Файлы прежних версий удаляются,
+    когда их перестают читать.
+    """
+    generation = manifest["version"] + 1
+    data_dir = os.path.dirname(table_info["data_file"]) or "data"
+    table_info["data_file"] = data_file_path(data_dir, table_name, options)
+    table_info["storage"] = options
+    
+    # Записи хранятся по возрастанию ID: на этом держится ORDER BY ID без сортировки
+    data = sorted(data, key=lambda record: record["ID"])
+    
+    if partitioning:
+        size = partitioning["size"]
+        groups = {}
+        for record in data:
+            groups.setdefault((record["ID"] - 1) // size, []).append(record)
+        partitions = [_partition_entry(data_dir, table_name, options, size, index)
+                      for index in sorted(groups)]
+        writes = [(partition, groups[partition["index"]]) for partition in partitions]
+        table_info["partitioning"] = partitioning
+        manifest["partitioning"] = partitioning
+    else:
+        writes = [({"file": table_info["data_file"]}, data)]
+        table_info.pop("partitioning", None)
+        manifest.pop("partitioning", None)
+    table_info.pop("partitions", None)
+    
+    manifest["storage"] = options
+    manifest["segments"] = []
+    totals = {"disk_bytes": 0, "raw_bytes": 0, "write_seconds": 0.0, "rows": len(data)}
+    for segment, rows in writes:
+        segment = {**segment, "generation": generation, "log_bytes": 0}
+        stats = _write_segment(segment, rows, options)
+        totals["disk_bytes"] += stats["bytes_written"]
+        totals["raw_bytes"] += stats["raw_bytes"]
+        totals["write_seconds"] += stats["write_seconds"]
+        manifest["segments"].append(segment)
+    
+    # Замеры полной записи в каждом из опробованных форматов - для сравнения в list_tables
+    totals["write_seconds"] = round(totals["write_seconds"], 6)
+    manifest.setdefault("storage_history", {}).setdefault(_storage_key(options), {}).update(totals)
+    commit_manifest(table_info, manifest)
+
+
+def iter_table_data(table_name, metadata, where_clause=None):
+    """
+    Потоково читает записи таблицы: в памяти одновременно находится
+    только один сегмент (раздел) таблицы.
+    
+    Читается снимок версии, зафиксированной на момент начала чтения:
+    одновременные записи не видны и не блокируют чтение.
+    Если таблица разбита на разделы и условие WHERE задает ID,
+    читается только раздел, содержащий этот ID.
+    """
+    table_info = metadata["tables"][table_name]
+    
+    with pin_snapshot(table_info, table_segments(table_info)) as manifest:
+        segments = manifest["segments"]
+        
+        # Отсекаем разделы, в которых не может быть искомого ID
+        record_id = (where_clause or {}).get("ID")
+        if "partitioning" in manifest and type(record_id) is int:
+            segment = _segment_for_id(table_name, table_info, manifest, record_id)
+            segments = [segment] if segment is not None else []
+        
+        for segment in segments:
+            data_file = segment_files(segment)[0]
+            
+            # Проверяем существование файла
+            if not os.path.exists(data_file):
+                raise FileNotFoundError(f"Файл данных {data_file} не существует для таблицы"
+                                        f" '{table_name}'")
+            
+            try:
+                # Чтение относится к фазе загрузки, даже когда поток потребляют
+                # сортировка или вывод
+                with span("table_load"):
+                    records = _load_segment(segment, manifest["storage"])
+            except json.JSONDecodeError as e:
+                print(f"Ошибка декодирования JSON в файле {data_file}: {e}")
+                continue
+            except Exception as e:
+                print(f"Неожиданная ошибка при загрузке файла {data_file}: {e}")
+                continue
+            yield from records
+
+
 @log_time
 @handle_db_errors
-def load_table_data(table_name, metadata):
+def load_table_data(table_name, metadata, where_clause=None):
     """
-    Загружает данные таблицы из файла.
+    Загружает данные таблицы из файла (см. iter_table_data).
     """
     if "tables" not in metadata or table_name not in metadata["tables"]:
         raise KeyError(f"Таблица '{table_name}' не существует!")
     
-    data_file = metadata["tables"][table_name]["data_file"]
-    
-    # Проверяем существование файла
-    if not os.path.exists(data_file):
-        raise FileNotFoundError(f"Файл данных {data_file} не существует для таблицы '{table_name}'")
-    
-    try:
-        with open(data_file, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            return data
-    except json.JSONDecodeError as e:
-        print(f"Ошибка декодирования JSON в файле {data_file}: {e}")
-        return []
-    except Exception as e:
-        print(f"Неожиданная ошибка при загрузке файла {data_file}: {e}")
-        return []
+    return list(iter_table_data(table_name, metadata, where_clause))
+
 
 @log_time
 @handle_db_errors
 def save_table_data(table_name, data, metadata):
     """
-    Сохраняет данные таблицы в файл.
+    Сохраняет данные таблицы в файл (в файлы разделов, если таблица разбита)
+    как новую версию таблицы.
     """
     if "tables" not in metadata or table_name not in metadata["tables"]:
         raise KeyError(f"Таблица '{table_name}' не существует!")
     
-    data_file = metadata["tables"][table_name]["data_file"]
+    table_info = metadata["tables"][table_name]
     
     try:
-        with open(data_file, 'w', encoding='utf-8') as file:
-            json.dump(data, file, ensure_ascii=False, indent=2)
+        with write_lock(table_info):
+            manifest = _read_table_manifest(table_info)
+            _rewrite_table(table_name, table_info, manifest, data, manifest["storage"],
+                           manifest.get("partitioning"))
         return True
     except Exception as e:
-        raise Exception(f"Ошибка при сохранении файла данных {data_file}: {e}")
+        raise Exception(f"Ошибка при сохранении файла данных {table_info['data_file']}: {e}")
+
+
+def _assign_insert_ids(table_name, manifest, delta):
+    """
+    Назначает ID вставляемым записям по последней версии таблицы.
+    Вызывается под write_lock, поэтому одновременные вставки не получат один ID.
+    
+    Явный ID должен быть больше всех существующих: записи хранятся по возрастанию ID
+    (ORDER BY ID не сортирует), а вставка дописывается в конец журнала.
+    """
+    if not any(entry["op"] == "insert" for entry in delta):
+        return
+    
+    next_id = _max_record_id(manifest) + 1
+    for entry in delta:
+        if entry["op"] != "insert":
+            continue
+        
+        row = entry["row"]
+        if "ID" not in row:
+            entry["row"] = row = {"ID": next_id, **row}
+        elif row["ID"] < next_id:
+            raise ValueError(f"ID={row['ID']} в таблице '{table_name}' занят или меньше"
+                             f" последнего; ID новой записи должен быть не меньше {next_id}")
+        next_id = row["ID"] + 1
+
+
+@log_time
+@handle_db_errors
+def apply_table_delta(table_name, delta, metadata):
+    """
+    Сохраняет изменения таблицы дописыванием в журнал вместо перезаписи файла.
+    
+    Изменения раскладываются по сегментам по ID: затрагиваются только журналы
+    разделов с измененными записями. Вставка за пределы последнего раздела
+    создает новый раздел. Записям вставки без ID назначается следующий ID
+    (записи изменений дополняются им на месте).
+    Изменения становятся видны читателям одной новой версией таблицы.
+    
+    Args:
+        delta (list): Записи изменений {"op": "insert"|"update"|"delete", ...}
+    """
+    if "tables" not in metadata or table_name not in metadata["tables"]:
+        raise KeyError(f"Таблица '{table_name}' не существует!")
+    
+    if not delta:
+        return True
+    
+    table_info = metadata["tables"][table_name]
+    
+    with write_lock(table_info):
+        # Параметры хранения и разделы берутся из последней версии, а не из
+        # метаданных вызывающего: их мог изменить другой процесс
+        manifest = _read_table_manifest(table_info)
+        options = manifest["storage"]
+        _assign_insert_ids(table_name, manifest, delta)
+        
+        groups = {}
+        for entry in delta:
+            is_insert = entry["op"] == "insert"
+            record_id = entry["row"]["ID"] if is_insert else entry["ID"]
+            segment = _segment_for_id(table_name, table_info, manifest, record_id,
+                                      create=is_insert)
+            if segment is not None:
+                groups.setdefault(segment["file"], (segment, []))[1].append(entry)
+        
+        for segment, entries in groups.values():
+            data_file, log_file = segment_files(segment)
+            try:
+                segment["log_bytes"] = append_log(log_file, entries, segment["log_bytes"])
+            except Exception as e:
+                raise Exception(f"Ошибка при записи журнала изменений {log_file}: {e}")
+            
+            # Журнал вырос больше основного файла - сворачиваем его в файл нового поколения
+            if log_needs_compaction(data_file):
+                records = _load_segment(segment, options)
+                segment["generation"] = manifest["version"] + 1
+                segment["log_bytes"] = 0
+                _write_segment(segment, records, options)
+        
+        commit_manifest(table_info, manifest)
+    return True
+
+
+@log_time
+@handle_db_errors
+def set_table_storage(metadata, table_name, layout, compression="none"):
+    """
+    Меняет формат хранения таблицы и перезаписывает её файлы данных.
+    """
+    if "tables" not in metadata or table_name not in metadata["tables"]:
+        raise KeyError(f"Таблица '{table_name}' не существует!")
+    if layout not in STORAGE_LAYOUTS:
+        raise ValueError(f"Недопустимый формат '{layout}'. "
+                         f"Допустимые форматы: {', '.join(STORAGE_LAYOUTS)}")
+    check_compression(compression)
+    
+    table_info = metadata["tables"][table_name]
+    options = {"layout": layout, "compression": compression}
+    with write_lock(table_info):
+        manifest = _read_table_manifest(table_info)
+        data = _load_manifest_data(manifest)
+        
+        try:
+            _rewrite_table(table_name, table_info, manifest, data, options,
+                           manifest.get("partitioning"))
+        except Exception as e:
+            raise Exception(f"Ошибка при сохранении файлов данных таблицы '{table_name}': {e}")
+    
+    print(f"Таблица '{table_name}' хранится в формате {layout}, сжатие: {compression}")
+    print(f"Файлы данных: {', '.join(s['file'] for s in manifest['segments'])}")
+    return metadata
+
+
+@log_time
+@handle_db_errors
+def partition_table(metadata, table_name, size):
+    """
+    Разбивает таблицу на разделы по диапазонам ID заданного размера
+    (size = 0 - собрать таблицу обратно в один файл).
+    """
+    if "tables" not in metadata or table_name not in metadata["tables"]:
+        raise KeyError(f"Таблица '{table_name}' не существует!")
+    if not isinstance(size, int) or size < 0:
+        raise ValueError("Размер раздела должен быть неотрицательным целым числом")
+    
+    table_info = metadata["tables"][table_name]
+    partitioning = {"column": "ID", "size": size} if size else None
+    with write_lock(table_info):
+        manifest = _read_table_manifest(table_info)
+        data = _load_manifest_data(manifest)
+        
+        try:
+            _rewrite_table(table_name, table_info, manifest, data, manifest["storage"],
+                           partitioning)
+        except Exception as e:
+            raise Exception(f"Ошибка при сохранении файлов данных таблицы '{table_name}': {e}")
+    
+    if size:
+        print(f"Таблица '{table_name}' разбита на разделы по {size} ID: "
+              f"{len(manifest['segments'])}")
+    else:
+        print(f"Таблица '{table_name}' хранится в одном файле {table_info['data_file']}")
+    return metadata
+
+
+def table_snapshot_files(table_name, metadata):
+    """
+    Текущая версия таблицы и физические файлы её сегментов.
+    
+    Returns:
+        tuple: (манифест версии, [(сегмент, путь к основному файлу), ...])
+    """
+    manifest = _read_table_manifest(metadata["tables"][table_name])
+    return manifest, [(segment, segment_files(segment)[0]) for segment in manifest["segments"]]
+
+
+def table_size_estimate(table_name, metadata):
+    """
+    Оценка объема таблицы в байтах JSON без чтения данных: по замерам записи
+    из манифеста или заголовкам файлов и длине журналов.
+    """
+    manifest, segments = table_snapshot_files(table_name, metadata)
+    size = 0
+    for segment, data_file in segments:
+        info = get_storage_info(data_file, manifest["storage"], segment.get("write_stats"))
+        if info is None:
+            continue
+        size += info["raw_bytes"] or info["disk_bytes"]
+        log_bytes = segment["log_bytes"]
+        size += info["log_bytes"] if log_bytes is None else log_bytes
+    return size
+
+
+def table_signature(table_name, metadata):
+    """
+    Сигнатура версии таблицы (inode, время и размер манифеста, а до первой
+    записи - файлов данных и журналов). Меняется при любой записи в таблицу.
+    """
+    table_info = metadata["tables"][table_name]
+    paths = [manifest_path(table_info)]
+    if not os.path.exists(paths[0]):
+        paths = [path for segment in table_segments(table_info)
+                 for path in (segment["file"], log_file_path(segment["file"]))]
+    
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
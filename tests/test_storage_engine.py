@@ -0,0 +1,151 @@
+import multiprocessing
+import os
+import random
+
+import pytest
+
+from src.primitive_db import core, snapshot, storage, utils
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Пустая база во временном каталоге (пути данных относительные)."""
+    monkeypatch.chdir(tmp_path)
+    metadata = {}
+    utils.create_table(metadata, "t", [("name", "str")])
+    return metadata
+
+
+def _insert(metadata, *names):
+    entries = [{"op": "insert", "row": {"name": name}} for name in names]
+    assert utils.apply_table_delta("t", entries, metadata)
+    return [entry["row"]["ID"] for entry in entries]
+
+
+def _segment_paths(manifest):
+    return [path for segment in manifest["segments"]
+            for path in snapshot.segment_files(segment)]
+
+
+def test_snapshot_survives_compaction(db, monkeypatch):
+    """Закрепленная версия читается целиком, пока писатели сворачивают журнал."""
+    monkeypatch.setattr(storage, "LOG_COMPACT_MIN_BYTES", 256)
+    _insert(db, "a", "b")
+    table_info = db["tables"]["t"]
+
+    with snapshot.pin_snapshot(table_info, utils.table_segments(table_info)) as pinned:
+        for i in range(50):
+            _insert(db, f"x{i}")
+        current = snapshot.read_manifest(table_info, [])
+        assert current["segments"][0]["generation"] != pinned["segments"][0]["generation"]
+        assert all(os.path.exists(path) for path in _segment_paths(pinned))
+
+        rows = utils._load_manifest_data(pinned)
+        assert [row["name"] for row in rows] == ["a", "b"]
+
+    # После снятия закрепления следующая запись удаляет файлы старой версии
+    _insert(db, "c")
+    old_base = snapshot.segment_files(pinned["segments"][0])[0]
+    assert not os.path.exists(old_base)
+    assert len(utils.load_table_data("t", db)) == 53
+
+
+def test_log_replay_is_idempotent():
+    entries = [
+        {"op": "insert", "row": {"ID": 1, "name": "a"}},
+        {"op": "insert", "row": {"ID": 2, "name": "b"}},
+        {"op": "update", "ID": 1, "set": {"name": "c"}},
+        {"op": "delete", "ID": 2},
+    ]
+    once = storage.apply_log([], [dict(entry) for entry in entries])
+    twice = storage.apply_log([dict(row) for row in once], entries)
+    assert once == twice == [{"ID": 1, "name": "c"}]
+
+
+def test_read_log_stops_at_committed_length(tmp_path):
+    path = str(tmp_path / "t.log")
+    size = storage.append_log(path, [{"op": "delete", "ID": 1}])
+    with open(path, "ab") as file:
+        file.write(b'{"op": "delete", "ID"')  # недописанная запись упавшего писателя
+
+    assert storage.read_log(path, size) == [{"op": "delete", "ID": 1}]
+    size = storage.append_log(path, [{"op": "delete", "ID": 2}], committed_bytes=size)
+    assert [entry["ID"] for entry in storage.read_log(path, size)] == [1, 2]
+
+
+def test_external_sort_spills_and_merges(monkeypatch):
+    rows = [{"ID": i, "v": random.randint(0, 1000)} for i in range(1, 501)]
+    for row in rows[::9]:
+        del row["v"]
+
+    spilled = []
+    spill_run = core._spill_run
+    monkeypatch.setattr(core, "_spill_run",
+                        lambda *args: spilled.append(spill_run(*args)) or spilled[-1])
+
+    for descending in (False, True):
+        result = list(core.iter_sorted(iter(rows), "v", descending, memory_rows=40))
+        with_value = [row["v"] for row in rows if "v" in row]
+        assert [row["v"] for row in result if "v" in row] == sorted(with_value,
+                                                                    reverse=descending)
+        # Записи без значения идут в конце при любом направлении
+        assert all("v" not in row for row in result[len(with_value):])
+    assert spilled and not any(os.path.exists(path) for path in spilled)
+
+
+def test_partition_pruning_reads_one_segment(db, monkeypatch):
+    _insert(db, *(f"n{i}" for i in range(10)))
+    utils.partition_table(db, "t", 3)
+
+    loaded = []
+    load_segment = utils._load_segment
+    monkeypatch.setattr(utils, "_load_segment",
+                        lambda segment, options: loaded.append(segment["index"])
+                        or load_segment(segment, options))
+
+    # Читается только раздел с ID 7-9, фильтрация по WHERE - дело select
+    rows = utils.load_table_data("t", db, {"ID": 8})
+    assert [row["ID"] for row in rows] == [7, 8, 9]
+    assert loaded == [2]
+
+    loaded.clear()
+    assert [row["ID"] for row in utils.load_table_data("t", db)] == list(range(1, 11))
+    assert loaded == [0, 1, 2, 3]
+
+
+def test_insert_routes_by_manifest_with_stale_metadata(db):
+    stale = {"tables": {"t": dict(db["tables"]["t"])}}
+    _insert(db, "a", "b", "c")
+    utils.partition_table(db, "t", 2)
+
+    # Метаданные загружены до разбиения: раздел для ID 4 берется из манифеста
+    assert utils.apply_table_delta("t", [{"op": "insert", "row": {"name": "d"}}], stale)
+    rows = utils.load_table_data("t", db, {"ID": 4})
+    assert rows == [{"ID": 3, "name": "c"}, {"ID": 4, "name": "d"}]
+
+
+def test_explicit_id_below_maximum_is_rejected(db):
+    _insert(db, "a", "b", "c")
+    utils.apply_table_delta("t", [{"op": "delete", "ID": 2}], db)
+
+    assert utils.apply_table_delta("t", [{"op": "insert", "row": {"ID": 2, "name": "x"}}],
+                                   db) is None
+    assert [row["ID"] for row in utils.load_table_data("t", db)] == [1, 3]
+
+
+def _insert_worker(metadata, count):
+    for i in range(count):
+        _insert(metadata, f"w{os.getpid()}-{i}")
+
+
+@pytest.mark.skipif(os.name != "posix", reason="нужен fork")
+def test_concurrent_inserts_get_unique_ids(db):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_insert_worker, args=(db, 15)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    ids = [row["ID"] for row in utils.load_table_data("t", db)]
+    assert ids == list(range(1, 61))